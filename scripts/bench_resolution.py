@@ -0,0 +1,113 @@
+#! usr/bin/env python3
+
+"""
+Micro-benchmark of the pos and lemma resolution of Token.
+
+Compares the per-call cost of the original Token.get_pos/Token.get_lemma, which analysed the
+dictionary entry of the wordform on every call, with the precomputed resolution table,
+and the cost of resolving multiword components with and without the memo of Token.resolve.
+The queries are drawn with a Zipfian distribution, as wordforms are in a corpus.
+The results of both implementations are checked to be the same, first on small dictionaries
+covering the shapes of entries (see check_loading), in JSON and binary format, then on the benchmarked one.
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import timeit
+import json
+import random
+from lemma_dictionary import write_binary_dictionary
+from transform_semcor import Token
+
+def legacy_get_pos(dictionary, wordform, default='NA'):
+    wf = dictionary.get(wordform)
+    if wf and len(wf) == 1:
+        return list(wf.keys())[0], 'ok'
+    else:
+        if wf:
+            lemmas = list(wf.values())
+            status = 'ok' if lemmas.count(lemmas[0])==len(list(wf.values())) else 'pos_unsure'
+        else:
+            status = 'pos_unsure'
+        return default, status
+
+def legacy_get_lemma(dictionary, wordform, pos, default=None):
+    wf = dictionary.get(wordform)
+    default = default or wordform.lower()
+    if wf:
+        lemmas = list(wf.values())
+        if lemmas.count(lemmas[0])==len(list(wf.values())):
+            default, status = lemmas[0], 'ok'
+        else:
+            status = 'lemma_unsure'
+        return wf.get(pos, default), status
+    else:
+        return default, 'lemma_unsure'
+
+def queries(dictionary):
+    """(wordform, pos, default lemma) triples covering every entry, unknown pos and unknown wordforms."""
+    for wordform, entries in dictionary.items():
+        for pos in list(entries) + ['NA']:
+            yield wordform, pos, None
+        yield wordform + '_unknown', 'NN', wordform
+
+def check(dictionary_file, dictionary):
+    """Check that Token resolves every query of dictionary as the original implementation, with dictionary_file loaded."""
+    Token.set_dictionary_file(Path(dictionary_file))
+    for wordform, pos, default in queries(dictionary):
+        assert legacy_get_pos(dictionary, wordform, pos) == Token.get_pos(wordform, pos), wordform
+        assert legacy_get_lemma(dictionary, wordform, pos, default) == Token.get_lemma(wordform, pos, default), wordform
+
+samples = [{'Friday': {'NN': 'friday', 'NNP': 'friday'}, 'had': {'VB': 'have'}},
+           {'had': {'VB': 'have'}, 'saw': {'VB': 'see', 'NN': 'saw'}, 'well': {'RB': 'well', 'NN': 'well'}},
+           {'saw': {'VB': 'see', 'NN': 'saw'}, 'Friday': {'NN': 'friday', 'NNP': 'friday'}},
+           {'empty': {}, 'had': {'VB': 'have'}},
+           {}]
+
+def check_loading():
+    """Check the loading of small dictionaries whose first entry is unanimous, single-pos, ambiguous or empty."""
+    with TemporaryDirectory() as directory:
+        for index, dictionary in enumerate(samples):
+            dictionary_file = Path(directory) / 'sample{}.json'.format(index)
+            with dictionary_file.open('w') as file:
+                json.dump(dictionary, file)
+            check(dictionary_file, dictionary)
+            write_binary_dictionary(dictionary, dictionary_file.with_suffix('.bin'))
+            check(dictionary_file.with_suffix('.bin'), dictionary)
+
+def benchmark(dictionary_file, size = 200000, repeat = 5):
+    with Path(dictionary_file).open() as file:
+        dictionary = json.load(file)
+    check(dictionary_file, dictionary)
+    distinct = list(queries(dictionary))
+    sample = random.Random(0).choices(distinct, weights = [1 / rank for rank in range(1, len(distinct) + 1)], k = size)
+    def legacy():
+        for wordform, pos, default in sample:
+            pos, _ = legacy_get_pos(dictionary, wordform, pos)
+            legacy_get_lemma(dictionary, wordform, pos, default)
+    def table():
+        for wordform, pos, default in sample:
+            pos, _ = Token.get_pos(wordform, pos)
+            Token.get_lemma(wordform, pos, default)
+    def memoized():
+        for wordform, pos, default in sample:
+            Token.resolve(wordform, pos, default)
+    results = {}
+    for name, function in (('legacy', legacy), ('table', table), ('table+memo', memoized)):
+        seconds = min(timeit(function, number = 1) for _ in range(repeat))
+        results[name] = seconds / len(sample) * 1e9
+    return len(sample), results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Measures the per-token cost of pos and lemma resolution.')
+    parser.add_argument('-d', '--dictionary', type = Path, default = Token.dictionary_file,
+                        help = 'JSON lemma dictionary to benchmark with. Default is the one of Token.')
+    parser.add_argument('-n', '--size', type = int, default = 200000, help = 'Number of resolutions per run. Default is 200000.')
+    parser.add_argument('-r', '--repeat', type = int, default = 5, help = 'Number of repetitions; the best one is reported. Default is 5.')
+    args = parser.parse_args()
+    check_loading()
+    count, results = benchmark(args.dictionary, args.size, args.repeat)
+    print('{} resolutions (get_pos + get_lemma) per run.'.format(count))
+    for name, nanoseconds in results.items():
+        print('{:<12}{:>10.0f} ns/token{:>8.1f}x'.format(name, nanoseconds, results['legacy'] / nanoseconds))
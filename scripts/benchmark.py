@@ -0,0 +1,171 @@
+#! usr/bin/env python3
+
+"""
+Benchmarks of transform_semcor on a synthetic corpus generated by generate_corpus.
+
+Two kinds of measures are reported:
+- stages, measured in this process file by file (so memory stays bounded at any scale):
+  parsing (CorpusFile.load), Token.from_tag with multiword splitting, generate_tokenlist
+  (building the TokenTable), generate_context for the nodes of the concordance types,
+  and the per-file functions of the four writers on the already parsed file (with the writing of
+  the per-file outputs of semcor2token and semcor2run, the tables being kept in memory);
+- subcommands, each run in its own process on the whole corpus, with their wall-clock time
+  and peak memory: the sum of the peak resident set sizes (VmHWM) of the process and of its
+  --jobs workers, read from /proc while it runs. Unlike the maximum resident set size given
+  by wait4, VmHWM is not inherited from the benchmark process through fork and exec.
+Throughput is given in tokens (items of generate_tokenlist) per second.
+"""
+
+from pathlib import Path
+from sys import executable, modules
+from time import perf_counter, sleep
+import json
+import subprocess
+from argparse import Namespace
+from create_lemmadict import extract_words, list_files, merge_words, write_dictionary
+from generate_corpus import CorpusGenerator, generate_corpus
+from functools import partial
+from transform_semcor import (CorpusFile, Token, file2conc, file2R, file2run, file2token, generate_context,
+                              prepare_output_dir, running_text_lines, typetoken_lines, write_per_file)
+
+script_dir = Path(modules[__name__].__file__).parent
+stages = ('parse', 'Token.from_tag', 'generate_tokenlist', 'generate_context', 'semcor2r', 'semcor2conc', 'semcor2token', 'semcor2run')
+
+def frequent_lemmas(seed, count = 3):
+    """Return the most frequent open class lemmas of the corpus generated with a seed."""
+    return [lemma for lemma, pos in CorpusGenerator(seed, lexicon_size = 20000).lexicon[:count]]
+
+def benchmark_stages(input_files, output_dir, types):
+    """Time every stage on every file; returns the times by stage and the number of tokens."""
+    times = dict.fromkeys(stages, 0.0)
+    tokens = 0
+    args = Namespace(sense = False, multiword = False, verbose = False, types = types, left = 10, right = 10,
+                     separator = 'paragraph', pos = None, kind_id = 'lemma_pos', add_closest = False)
+    token_dir = prepare_output_dir(output_dir / 'typetoken', 'typetoken')
+    run_dir = prepare_output_dir(output_dir / 'running_text', 'running_text')
+    writers = (('semcor2r', file2R, lambda input_file, rows: None),
+               ('semcor2conc', file2conc, lambda input_file, rows: None),
+               ('semcor2token', file2token, partial(write_per_file, token_dir, typetoken_lines)),
+               ('semcor2run', file2run, partial(write_per_file, run_dir, running_text_lines)))
+    for input_file in input_files:
+        start = perf_counter()
+        corpus_file = CorpusFile(input_file)
+        corpus_file.load()
+        times['parse'] += perf_counter() - start
+        words = [word for word in corpus_file.words() if word.name == 'wf']
+        start = perf_counter()
+        for word in words:
+            Token.from_tag(word).get_components()
+        times['Token.from_tag'] += perf_counter() - start
+        start = perf_counter()
+        table = corpus_file.token_table()
+        times['generate_tokenlist'] += perf_counter() - start
+        tokens += len(table)
+        start = perf_counter()
+        for index in table.find(types):
+            generate_context(table, index, 10, 10, 'paragraph')
+        times['generate_context'] += perf_counter() - start
+        for name, function, write in writers:
+            start = perf_counter()
+            write(input_file, function(corpus_file, args))
+            times[name] += perf_counter() - start
+    return times, tokens
+
+def read_peaks(pid, peaks):
+    """Update peaks (pid -> peak resident set size in KiB) with the VmHWM of a process and of its descendants."""
+    children = []
+    try:
+        with open('/proc/{}/status'.format(pid)) as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    peaks[pid] = max(peaks.get(pid, 0), int(line.split()[1]))
+        for task in Path('/proc/{}/task'.format(pid)).iterdir():
+            children.extend(int(child) for child in (task / 'children').read_text().split())
+    except OSError:
+        # The process exited in the meantime.
+        pass
+    for child in children:
+        read_peaks(child, peaks)
+
+def run_subcommand(arguments, cwd, interval = 0.005):
+    """Run transform_semcor in a new process; returns its wall-clock time and peak memory in MiB."""
+    start = perf_counter()
+    process = subprocess.Popen([executable, (script_dir / 'transform_semcor.py').as_posix()] + arguments,
+                               cwd = cwd, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    peaks = {}
+    while process.poll() is None:
+        read_peaks(process.pid, peaks)
+        sleep(interval)
+    if process.returncode:
+        raise RuntimeError('transform_semcor.py {} failed.'.format(' '.join(arguments)))
+    return perf_counter() - start, sum(peaks.values()) / 1024
+
+def benchmark_subcommands(corpus_dir, work_dir, dictionary_file, types, jobs):
+    """Run every subcommand on the whole corpus; the last ones use the compiled cache and the lemma index."""
+    output_dir = work_dir / 'output'
+    common = ['-i', corpus_dir.as_posix(), '-d', dictionary_file.as_posix(), '-j', str(jobs)]
+    no_cache = ['--cache', (work_dir / 'missing.cache').as_posix()]
+    cache = ['--cache', (work_dir / 'semcor.cache').as_posix()]
+    index = ['--index', (work_dir / 'semcor.index').as_posix()]
+    conc = ['-t'] + types + ['-o', (output_dir / 'conc.csv').as_posix()]
+    runs = (('semcor2r', ['semcor2r', '-o', (output_dir / 'semcor2r.csv').as_posix()] + no_cache),
+            ('semcor2conc', ['semcor2conc'] + conc + ['--index', (work_dir / 'missing.index').as_posix()] + no_cache),
+            ('semcor2token', ['semcor2token', '-o', (output_dir / 'typetoken').as_posix()] + no_cache),
+            ('semcor2run', ['semcor2run', '-o', (output_dir / 'running_text').as_posix()] + no_cache),
+            ('semcor2all', ['semcor2all', '--semcor2r', (output_dir / 'all_semcor2r.csv').as_posix(),
+                            '--semcor2token', (output_dir / 'all_typetoken').as_posix(),
+                            '--semcor2run', (output_dir / 'all_running_text').as_posix(), '--semcor2conc'] + types +
+                            ['--conc_dir', output_dir.as_posix()] + no_cache),
+            ('compile', ['compile'] + cache),
+            ('index', ['index'] + index + cache),
+            ('semcor2conc (cache, index)', ['semcor2conc'] + conc + index + cache))
+    results = {}
+    for name, arguments in runs:
+        seconds, memory = run_subcommand(arguments[:1] + common + arguments[1:], work_dir)
+        results[name] = {'seconds': seconds, 'peak_mib': memory}
+        print('{:<28}{:>10.3f} s{:>10.1f} MiB'.format(name, seconds, memory))
+    return results
+
+def benchmark(work_dir, scale = 1.0, seed = 0, jobs = 1, subcommands = True):
+    work_dir = Path(work_dir).resolve()
+    corpus_dir = work_dir / 'semcor'
+    output_dir = work_dir / 'output'
+    output_dir.mkdir(parents = True, exist_ok = True)
+    start = perf_counter()
+    input_files = generate_corpus(corpus_dir, scale, seed)
+    print('{} files generated in {:.3f} s.'.format(len(input_files), perf_counter() - start))
+    dictionary = {}
+    for input_file in list_files(corpus_dir):
+        merge_words(dictionary, extract_words(input_file))
+    dictionary_file = work_dir / 'lemma_dictionary.json'
+    write_dictionary(dictionary, dictionary_file)
+    Token.set_dictionary_file(dictionary_file)
+    types = frequent_lemmas(seed)
+    times, tokens = benchmark_stages(list_files(corpus_dir), output_dir, types)
+    report = {'scale': scale, 'seed': seed, 'files': len(input_files), 'tokens': tokens, 'jobs': jobs, 'stages': {}, 'subcommands': {}}
+    print('\n{:<28}{:>12}{:>14}'.format('stage', 'seconds', 'tokens/s'))
+    for name, seconds in times.items():
+        report['stages'][name] = {'seconds': seconds, 'tokens_per_second': tokens / seconds if seconds else None}
+        print('{:<28}{:>12.3f}{:>14.0f}'.format(name, seconds, tokens / seconds if seconds else 0))
+    if subcommands:
+        print('\n{:<28}{:>12}{:>14}'.format('subcommand', 'seconds', 'peak memory'))
+        report['subcommands'] = benchmark_subcommands(corpus_dir, work_dir, dictionary_file, types, jobs)
+        for result in report['subcommands'].values():
+            result['tokens_per_second'] = tokens / result['seconds']
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Benchmarks the stages and subcommands of transform_semcor on a synthetic corpus.')
+    parser.add_argument('work_dir', type = Path, help = 'Directory for the synthetic corpus, dictionary and outputs.')
+    parser.add_argument('-s', '--scale', type = float, default = 1.0, help = 'Size of the corpus relative to SemCor. Default is 1.')
+    parser.add_argument('--seed', type = int, default = 0, help = 'Seed of the corpus generator. Default is 0.')
+    parser.add_argument('-j', '--jobs', type = int, default = 1, help = 'Number of processes for the subcommands. Default is 1.')
+    parser.add_argument('--stages_only', action = 'store_true', help = 'Only measures the stages, without running the subcommands.')
+    parser.add_argument('--json', type = Path, help = 'Option to write the report in a JSON file.')
+    args = parser.parse_args()
+    report = benchmark(args.work_dir, args.scale, args.seed, args.jobs, not args.stages_only)
+    if args.json:
+        with args.json.open('w') as file:
+            json.dump(report, file, indent = 2)
@@ -0,0 +1,67 @@
+#! usr/bin/env python3
+
+"""
+Counts and association scores of the collocates of node types, for the collocates subcommand of transform_semcor.
+
+Counts follow the surface co-occurrence model: a collocate co-occurs with a node when it is
+one of the words of the window of the node (punctuation marks are neither counted nor
+part of the windows). For each node (and, optionally, each of its sense keys), the observed
+frequency O of a collocate is compared with its expected frequency E = R * C / N, where R is the
+total size of the windows of the node, C the frequency of the collocate and N the number of words.
+PMI is log2(O / E); the log-likelihood is G2 = 2 * sum(O_ij * ln(O_ij / E_ij)) over the four cells
+of the contingency table of the window positions, signed: it is negative when O < E, so that
+collocates that occur less often than expected near the node come last when rows are ranked by it.
+"""
+
+from collections import Counter
+from math import log, log2
+
+columns = ['node', 'sense_key', 'collocate', 'frequency', 'node_frequency', 'window_size',
+           'collocate_frequency', 'pmi', 'log_likelihood']
+
+def association(observed, window_size, collocate_frequency, words):
+    """Return the PMI and signed log-likelihood of a collocate observed a number of times in the windows of a node."""
+    expected = window_size * collocate_frequency / words
+    pmi = log2(observed / expected)
+    rows = (window_size, words - window_size)
+    cells = ((observed, window_size - observed),
+             (collocate_frequency - observed, words - window_size - collocate_frequency + observed))
+    log_likelihood = 0.0
+    for row, (o1, o2) in zip(rows, cells):
+        for column, o in zip((collocate_frequency, words - collocate_frequency), (o1, o2)):
+            if o > 0:
+                log_likelihood += o * log(o / (row * column / words))
+    return pmi, 2 * log_likelihood if observed >= expected else -2 * log_likelihood
+
+class CollocationCounts:
+    """Counters of nodes, window sizes, co-occurrences and types, by node key and sense key ('*' for all senses).
+    The counts of several files are merged with add."""
+    def __init__(self):
+        self.nodes = Counter()
+        self.windows = Counter()
+        self.pairs = Counter()
+        self.types = Counter()
+        self.words = 0
+
+    def add(self, other):
+        self.nodes.update(other.nodes)
+        self.windows.update(other.windows)
+        self.pairs.update(other.pairs)
+        self.types.update(other.types)
+        self.words += other.words
+        return self
+
+    def rows(self, min_frequency = 1):
+        """Generate the rows of the collocation table, by node and sense key, the strongest collocates first
+        (by decreasing signed log-likelihood, so that collocates repelled by the node come last)."""
+        scored = []
+        for (node, sense_key, collocate), observed in self.pairs.items():
+            if observed < min_frequency:
+                continue
+            window_size = self.windows[node, sense_key]
+            collocate_frequency = self.types[collocate]
+            pmi, log_likelihood = association(observed, window_size, collocate_frequency, self.words)
+            scored.append((node, sense_key, -log_likelihood, collocate, observed, window_size, collocate_frequency, pmi))
+        for node, sense_key, log_likelihood, collocate, observed, window_size, collocate_frequency, pmi in sorted(scored):
+            yield [node, sense_key, collocate, str(observed), str(self.nodes[node, sense_key]), str(window_size),
+                   str(collocate_frequency), '{:.4f}'.format(pmi), '{:.4f}'.format(-log_likelihood)]
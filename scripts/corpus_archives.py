@@ -0,0 +1,152 @@
+#! usr/bin/env python3
+
+"""
+Tagfiles read directly from tar (possibly compressed) or zip archives of the corpus.
+
+An ArchiveMember stands for a 'brown?/tagfiles/*' member of an archive wherever the path of an
+extracted tagfile is used: it has the parts, name and stem of its path in the archive (so that
+the concordance and the short name of a CorpusFile are the same as if it was extracted),
+an identity for the cache and the index, and it opens as a stream. Archives are opened once
+per process, so that the workers of a pool do not share file offsets and each member
+does not reopen (and, for compressed tar files, re-scan) its archive. tarfile and zipfile are only
+imported when an archive is actually read.
+
+A compressed tar file can only be read forward: going back to an earlier member decompresses it
+again from its start. So members are read in the order of their offsets in the archive (see
+read_key), and their hashes are all computed in one sequential pass over the archive.
+"""
+
+from hashlib import sha1
+from pathlib import Path, PurePosixPath
+import io
+import os
+
+handles = {}
+hashes = {}
+
+def is_archive(path):
+    path = Path(path)
+    if not path.is_file():
+        return False
+    import tarfile, zipfile
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+def load_archive(archive):
+    import tarfile, zipfile
+    return zipfile.ZipFile(archive) if zipfile.is_zipfile(archive) else tarfile.open(archive)
+
+def open_archive(archive):
+    """Return the TarFile or ZipFile of an archive, opened once per process."""
+    key = (archive, os.getpid())
+    if not key in handles:
+        handles[key] = load_archive(archive)
+    return handles[key]
+
+def list_members(archive):
+    """Return the ArchiveMembers of the tagfiles of an archive."""
+    from datetime import datetime
+    import zipfile
+    archive = Path(archive).resolve()
+    with load_archive(archive) as handle:
+        if isinstance(handle, zipfile.ZipFile):
+            infos = [(info.filename, datetime(*info.date_time).timestamp(), info.file_size, info.header_offset)
+                     for info in handle.infolist() if not info.is_dir()]
+        else:
+            infos = [(info.name, info.mtime, info.size, info.offset) for info in handle.getmembers() if info.isfile()]
+    return [ArchiveMember(archive, name, int(mtime * 10**9), size, offset)
+            for name, mtime, size, offset in infos if PurePosixPath(name).match('brown?/tagfiles/*')]
+
+def hash_members(archive):
+    """Compute the sha1 hashes of all the files of a tar archive, reading it once as a stream."""
+    import tarfile
+    with tarfile.open(archive, 'r|*') as handle:
+        for info in handle:
+            if info.isfile():
+                content = handle.extractfile(info).read()
+                hashes[archive, info.name, int(info.mtime * 10**9), info.size] = sha1(content).hexdigest()
+
+def open_file(filename):
+    """Open a tagfile, extracted or in an archive, in text mode."""
+    if isinstance(filename, ArchiveMember):
+        return filename.open()
+    return open(filename)
+
+def sort_key(filename):
+    """Order of the files of list_files: that of their paths, members coming at the place of their archive."""
+    if isinstance(filename, ArchiveMember):
+        return filename.archive.parts + filename.parts
+    return Path(filename).parts
+
+def read_key(filename):
+    """Order in which files are best read: that of list_files, except that the members of an archive
+    come in the order of their offsets in it."""
+    if isinstance(filename, ArchiveMember):
+        return filename.archive.parts + (filename.offset,)
+    return Path(filename).parts
+
+class ArchiveMember:
+    """A tagfile in an archive, with the path attributes of the extracted file used by the scripts."""
+    def __init__(self, archive, name, mtime_ns, size, offset = 0):
+        self.archive = Path(archive)
+        self.member = name
+        self.path = PurePosixPath(name)
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.offset = offset
+
+    @property
+    def parts(self):
+        return self.path.parts
+
+    @property
+    def name(self):
+        return self.path.name
+
+    @property
+    def stem(self):
+        return self.path.stem
+
+    def as_posix(self):
+        return '{}/{}'.format(self.archive.as_posix(), self.path.as_posix())
+
+    __str__ = as_posix
+
+    def __repr__(self):
+        return 'ArchiveMember({!r}, {!r})'.format(self.archive.as_posix(), self.path.as_posix())
+
+    def __eq__(self, other):
+        return isinstance(other, ArchiveMember) and (self.archive, self.path) == (other.archive, other.path)
+
+    def __hash__(self):
+        return hash((self.archive, self.path))
+
+    def key(self):
+        """Identity of the member in the cache and the index."""
+        return '{}/{}'.format(self.archive.resolve().as_posix(), self.path.as_posix())
+
+    def signature(self):
+        return self.mtime_ns, self.size
+
+    def hash(self):
+        """sha1 of the content of the member; those of a tar archive are computed all at once and kept."""
+        import zipfile
+        if zipfile.is_zipfile(self.archive):
+            return sha1(self.read_bytes()).hexdigest()
+        key = (self.archive, self.member, self.mtime_ns, self.size)
+        if not key in hashes:
+            hash_members(self.archive)
+        return hashes[key]
+
+    def open_binary(self):
+        import zipfile
+        handle = open_archive(self.archive)
+        if isinstance(handle, zipfile.ZipFile):
+            return handle.open(self.member)
+        return handle.extractfile(self.member)
+
+    def open(self):
+        return io.TextIOWrapper(self.open_binary())
+
+    def read_bytes(self):
+        with self.open_binary() as file:
+            return file.read()
@@ -0,0 +1,189 @@
+#! usr/bin/env python3
+
+"""
+Parse-once binary cache of SemCor3.0 tagfiles.
+
+The events of semcor_reader.iter_events are compiled into one memory-mappable file:
+a JSON header (interned string table, per-file offsets, modification times and hashes)
+followed by columns of unsigned 32 bit integers.
+Token columns ('name', 'string', 'pos', 'lemma', 'wnsn', 'lexsn') hold string ids
+(0 meaning the attribute is missing) for every 'wf' and 'punc' element;
+boundary columns ('position', 'code') hold, for every paragraph or sentence start or end,
+the index of the token it precedes within its file and the kind of boundary.
+Replaying a cached file yields exactly the same events as parsing it.
+"""
+
+from array import array
+from hashlib import sha1
+from pathlib import Path
+import json
+import mmap
+import os
+from semcor_reader import Element, iter_events
+from corpus_archives import ArchiveMember, read_key
+
+magic = b'SEMCORC1'
+version = 1
+attributes = ('pos', 'lemma', 'wnsn', 'lexsn')
+token_columns = ('name', 'string') + attributes
+boundary_columns = ('position', 'code')
+boundaries = (('start', 'p'), ('end', 'p'), ('start', 's'), ('end', 's'))
+
+def file_key(filename):
+    if isinstance(filename, ArchiveMember):
+        return filename.key()
+    return Path(filename).resolve().as_posix()
+
+def file_hash(filename):
+    if isinstance(filename, ArchiveMember):
+        return filename.hash()
+    with open(filename, 'rb') as file:
+        return sha1(file.read()).hexdigest()
+
+def file_signature(filename):
+    """Return the modification time and size of a file (or archive member), as stored in the cache."""
+    if isinstance(filename, ArchiveMember):
+        return filename.signature()
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+class CorpusCache:
+    """Read-only view of a compiled cache file."""
+    def __init__(self, cache_file):
+        self.cache_file = Path(cache_file)
+        with self.cache_file.open('rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(magic)] != magic:
+            raise ValueError('"{}" is not a corpus cache.'.format(self.cache_file))
+        header_end = len(magic) + 8 + int.from_bytes(self.map[len(magic):len(magic) + 8], 'little')
+        header = json.loads(self.map[len(magic) + 8:header_end].decode('utf-8'))
+        data_start = header_end + -header_end % 4
+        if header['version'] != version:
+            raise ValueError('"{}" was compiled by another version.'.format(self.cache_file))
+        self.files = header['files']
+        self.strings = [None] + header['strings']
+        self.view = memoryview(self.map)
+        self.columns = {name: self.view[data_start + start:data_start + end].cast('I')
+                        for name, (start, end) in header['columns'].items()}
+
+    def __contains__(self, filename):
+        return file_key(filename) in self.files
+
+    def is_fresh(self, filename):
+        """Check whether the cached copy of a file is still valid (same mtime and size, or same content)."""
+        entry = self.files.get(file_key(filename))
+        if not entry:
+            return False
+        mtime, size = file_signature(filename)
+        if (mtime, size) == (entry['mtime'], entry['size']):
+            return True
+        return size == entry['size'] and file_hash(filename) == entry['hash']
+
+    def events(self, filename):
+        """Replay the events of a cached file, as semcor_reader.iter_events would generate them."""
+        entry = self.files[file_key(filename)]
+        strings = self.strings
+        token_start, token_count = entry['tokens']
+        boundary, boundary_end = entry['boundaries']
+        boundary_end += boundary
+        name, string = self.columns['name'], self.columns['string']
+        values = [self.columns[attribute] for attribute in attributes]
+        position, code = self.columns['position'], self.columns['code']
+        for index in range(token_count):
+            while boundary < boundary_end and position[boundary] == index:
+                event, tag = boundaries[code[boundary]]
+                yield event, Element(tag, {})
+                boundary += 1
+            row = token_start + index
+            attrs = {attribute: strings[column[row]] for attribute, column in zip(attributes, values) if column[row]}
+            yield 'end', Element(strings[name[row]], attrs, strings[string[row]])
+        while boundary < boundary_end:
+            event, tag = boundaries[code[boundary]]
+            yield event, Element(tag, {})
+            boundary += 1
+
+    def file_tokens(self, filename):
+        """Return the tokens of a cached file as tuples of string ids (of 'name', 'string' and the attributes),
+        and its boundaries as (token index, boundary code) pairs: what events replays, without building Elements."""
+        entry = self.files[file_key(filename)]
+        token_start, token_count = entry['tokens']
+        boundary_start, boundary_count = entry['boundaries']
+        tokens = zip(*(self.columns[name][token_start:token_start + token_count].tolist() for name in token_columns))
+        bounds = zip(*(self.columns[name][boundary_start:boundary_start + boundary_count].tolist() for name in boundary_columns))
+        return list(tokens), list(bounds)
+
+    def element(self, ids):
+        """Return the Element of a token given as a tuple of string ids by file_tokens."""
+        attrs = {attribute: self.strings[value] for attribute, value in zip(attributes, ids[2:]) if value}
+        return Element(self.strings[ids[0]], attrs, self.strings[ids[1]])
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.view.release()
+        self.map.close()
+
+def compile_cache(input_files, cache_file):
+    """Compile the input files into a cache file.
+    Files that are still fresh in an existing cache are copied from it instead of parsed again."""
+    cache_file = Path(cache_file)
+    previous = None
+    if cache_file.exists():
+        try:
+            previous = CorpusCache(cache_file)
+        except ValueError:
+            pass
+    string_ids = {}
+    strings = []
+    def intern(value):
+        if value is None:
+            return 0
+        if value not in string_ids:
+            strings.append(value)
+            string_ids[value] = len(strings)
+        return string_ids[value]
+    columns = {name: array('I') for name in token_columns + boundary_columns}
+    files = {}
+    codes = {boundary: code for code, boundary in enumerate(boundaries)}
+    parsed = 0
+    for input_file in sorted(input_files, key = read_key):
+        fresh = previous is not None and previous.is_fresh(input_file)
+        events = previous.events(input_file) if fresh else iter_events(input_file)
+        token_start = len(columns['name'])
+        boundary_start = len(columns['position'])
+        for event, element in events:
+            if element.name in ('p', 's'):
+                columns['position'].append(len(columns['name']) - token_start)
+                columns['code'].append(codes[(event, element.name)])
+            else:
+                columns['name'].append(intern(element.name))
+                columns['string'].append(intern(element.string))
+                for attribute in attributes:
+                    columns[attribute].append(intern(element.get(attribute)))
+        mtime, size = file_signature(input_file)
+        files[file_key(input_file)] = {
+            'mtime': mtime, 'size': size,
+            'hash': previous.files[file_key(input_file)]['hash'] if fresh else file_hash(input_file),
+            'tokens': [token_start, len(columns['name']) - token_start],
+            'boundaries': [boundary_start, len(columns['position']) - boundary_start]}
+        parsed += not fresh
+    if previous is not None:
+        previous.close()
+    header = {'version': version, 'files': files, 'strings': strings, 'columns': {}}
+    offset = 0
+    for name, column in columns.items():
+        header['columns'][name] = [offset, offset + column.itemsize * len(column)]
+        offset += column.itemsize * len(column)
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_end = len(magic) + 8 + len(header_bytes)
+    temporary = cache_file.with_name(cache_file.name + '.tmp')
+    with temporary.open('wb') as file:
+        file.write(magic)
+        file.write(len(header_bytes).to_bytes(8, 'little'))
+        file.write(header_bytes)
+        file.write(b'\0' * (-header_end % 4))
+        for column in columns.values():
+            column.tofile(file)
+    temporary.replace(cache_file)
+    return parsed
@@ -1,8 +1,12 @@
 #! usr/bin/env python3
+from hashlib import sha1
 import json
 from pathlib import Path
-from bs4 import BeautifulSoup
 from sys import modules, stderr
+from semcor_reader import iter_words
+from lemma_dictionary import write_binary_dictionary
+from corpus_cache import file_hash
+from corpus_archives import is_archive, list_members, read_key, sort_key
 
 """
 Generate lemma_dictionary for Token class in semcorproc
@@ -12,11 +16,14 @@ output_default = script_dir.resolve().parent / 'Output'
 semcor_default = script_dir.resolve().parent / 'Semcor'
 
 def list_files(*paths):
+    """List the tagfiles in the given files, directories and tar or zip archives of the corpus."""
     file_list = set()
     for path in paths:
         path = Path(path)
         if path.is_file() and path.match('brown?/tagfiles/*'):
             file_list.add(path)
+        elif is_archive(path):
+            file_list.update(list_members(path))
         elif path.is_dir():
             files = (path.match('brown?')) and list(path.glob('tagfiles/*')) or list(path.glob('**/brown?/tagfiles/*'))
             for filename in files:
@@ -25,36 +32,153 @@ def list_files(*paths):
         else:
             print('Invalid file name. Corpus files must be in a "tagfiles" directory\
                   inside a "brown1", "brown2" or "brownv" directory.', file=stderr)
-    return file_list
+    return sorted(file_list, key = sort_key)
 
-input_files = list_files(semcor_default / 'brown1', semcor_default / 'brown2', semcor_default / 'brownv')
+def map_files(function, input_files, jobs = 1, initializer = None, initargs = (), key = read_key):
+    """Apply function to each input file, distributing the files among jobs processes if jobs > 1.
+    The results are generated in the order of input_files, whatever the number of processes.
+    Initializer is called once per process, so that expensive state is not reloaded for every file.
+    The files are processed in the order of key (by default that of read_key, in which the members of
+    an archive come in the order of their offsets) and their results put back in order."""
+    order = sorted(range(len(input_files)), key = lambda index: key(input_files[index]))
+    tasks = [input_files[index] for index in order]
+    if jobs > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+        with Pool(jobs, initializer = initializer, initargs = initargs) as pool:
+            yield from reorder(pool.imap(function, tasks), order)
+    else:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from reorder(map(function, tasks), order)
 
-def create_dictionary(input_files = input_files):
-    dictionary_file = output_default / 'lemma_dictionary.json'
+def reorder(results, order):
+    """Generate the results of the files of indices order in the order of the indices,
+    keeping those that come early until their turn."""
+    pending = {}
+    next_index = 0
+    for index, result in zip(order, results):
+        pending[index] = result
+        while next_index in pending:
+            yield pending.pop(next_index)
+            next_index += 1
+
+def file_hash_of_text(text):
+    return sha1(text.encode('utf-8')).hexdigest()
+
+def default_input_files():
+    return list_files(semcor_default / 'brown1', semcor_default / 'brown2', semcor_default / 'brownv')
+
+closed_classes = ['EX', 'IN', 'PDT', 'DT', 'POS', 'PRP', 'PRP$', 'RP',
+                  'TO', 'UH', 'WDT', 'LS', 'WP', 'WP$', 'CC', 'CD', 'FW']
+
+def word_entries(words):
+    """Extract the (wordform, pos, lemma) triples of the single words among 'wf' and 'punc' elements, in order."""
+    entries = []
+    for word in words:
+        if word.name == 'wf' and not '_' in word.string:
+            entries.append((word.string, word.get('pos'), word.get('lemma')))
+    return entries
+
+def extract_words(input_file):
+    """Extract the (wordform, pos, lemma) triples of the single words of a file, in order."""
+    return word_entries(iter_words(input_file))
+
+def merge_words(dictionary, words):
+    """Add (wordform, pos, lemma) triples to the dictionary: the first lemma of a wordform and pos is kept,
+    and words of closed classes without lemma get their lowercased wordform."""
+    for wordform, pos, lemma in words:
+        if pos and lemma:
+            if not wordform in dictionary:
+                dictionary[wordform] = {pos:lemma}
+            elif not pos in dictionary[wordform]:
+                dictionary[wordform][pos] = lemma
+        elif pos in closed_classes:
+            dictionary[wordform] = {pos:wordform.lower()}
+
+def partial_dictionary(words):
+    """Reduce the (wordform, pos, lemma) triples of a file to the operations they perform in merge_words,
+    grouped by wordform: [pos, lemma] adds a lemma, [pos, None] resets the wordform to a closed class.
+    Adding a pos already added since the last reset of the wordform does nothing, so it is dropped,
+    and so is a reset identical to the previous operation.
+    Merging the partial dictionaries of several files in order gives the same result as merging all their words."""
+    partial = {}
+    for wordform, pos, lemma in words:
+        if pos and lemma:
+            operation = [pos, lemma]
+        elif pos in closed_classes:
+            operation = [pos, None]
+        else:
+            continue
+        operations = partial.setdefault(wordform, [])
+        if lemma:
+            since_reset = operations[max((i for i, (_, value) in enumerate(operations) if value is None), default = -1) + 1:]
+            if any(added == pos for added, _ in since_reset):
+                continue
+        elif operations and operations[-1] == operation:
+            continue
+        operations.append(operation)
+    return partial
+
+def merge_partial(dictionary, partial):
+    """Apply the operations of a partial dictionary, as merge_words would apply the words it was made from."""
+    for wordform, operations in partial.items():
+        merge_words(dictionary, ((wordform, pos, lemma) for pos, lemma in operations))
+
+def extract_partial(input_file):
+    """Compute the partial dictionary of a file."""
+    return partial_dictionary(extract_words(input_file))
+
+def create_dictionary(input_files = None, jobs = 1, binary = False, cache_dir = output_default / 'lemmadict_cache'):
+    """Create the lemma dictionary of the input files (all the corpus by default).
+    The partial dictionary of every file is cached in cache_dir under the hash of its content
+    (and of the closed classes), so that only new or changed files are parsed, in jobs processes."""
+    if input_files is None:
+        input_files = default_input_files()
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents = True, exist_ok = True)
+    rules = file_hash_of_text(json.dumps(closed_classes))
+    partial_files = [cache_dir / '{}.json'.format(file_hash_of_text(file_hash(input_file) + rules)) for input_file in input_files]
+    stale = [input_file for input_file, partial_file in zip(input_files, partial_files) if not partial_file.exists()]
+    extracted = dict(zip(stale, map_files(extract_partial, stale, jobs)))
     dictionary = {}
-    closed_classes = ['EX', 'IN', 'PDT', 'DT', 'POS', 'PRP', 'PRP$', 'RP',
-                      'TO', 'UH', 'WDT', 'LS', 'WP', 'WP$', 'CC', 'CD', 'FW']
-    for input_file in input_files:
-        with input_file.open() as file:
-            text = BeautifulSoup(file, 'lxml')
-            for word in text.find_all('wf'):
-                wordform = word.string
-                if not '_' in wordform:
-                    pos = word.get('pos')
-                    lemma = word.get('lemma')
-                    if pos and lemma:
-                        if not wordform in dictionary:
-                            dictionary[wordform] = {pos:lemma}
-                        elif not pos in dictionary[wordform]:
-                            dictionary[wordform][pos] = lemma
-                    elif pos in closed_classes:
-                        dictionary[wordform] = {pos:wordform.lower()}
-        print('File "{}" loaded.'.format(input_file.stem))
+    for input_file, partial_file in zip(input_files, partial_files):
+        if input_file in extracted:
+            partial = extracted.pop(input_file)
+            temporary = partial_file.with_suffix('.tmp')
+            with temporary.open('w') as file:
+                json.dump(partial, file)
+            temporary.replace(partial_file)
+            print('File "{}" loaded.'.format(input_file.stem))
+        else:
+            with partial_file.open() as file:
+                partial = json.load(file)
+            print('File "{}" loaded from cache.'.format(input_file.stem))
+        merge_partial(dictionary, partial)
+    write_dictionary(dictionary, binary = binary)
+
+def write_dictionary(dictionary, dictionary_file = output_default / 'lemma_dictionary.json', binary = False):
+    """Write the dictionary in JSON and, if binary is True, in the binary format next to it."""
+    dictionary_file = Path(dictionary_file)
     with dictionary_file.open('w') as file:
         json.dump(dictionary, file)
         print('The file "{}" was created.\n'.format(dictionary_file.as_posix()))
         print('The dictionary has {} wordforms.'.format(len(dictionary)))
+    if binary:
+        binary_file = dictionary_file.with_suffix('.bin')
+        write_binary_dictionary(dictionary, binary_file)
+        print('The file "{}" was created.'.format(binary_file.as_posix()))
 
 
 if __name__ == '__main__':
-    create_dictionary(input_files)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Generates the lemma dictionary from the semcor files.')
+    parser.add_argument('-i', '--input_files', nargs = '*', type = Path,
+                        help = 'Corpus files, directories or tar/zip archives. Default is the whole corpus.')
+    parser.add_argument('-j', '--jobs', type = int, default = 1, help = 'Number of processes among which the files are distributed. Default is 1.')
+    parser.add_argument('--cache_dir', type = Path, default = output_default / 'lemmadict_cache',
+                        help = 'Directory of the cached partial dictionaries of the files. Default is "lemmadict_cache" in the output folder.')
+    parser.add_argument('-b', '--binary', action = 'store_true',
+                        help = 'Also writes the dictionary in the memory-mapped binary format ("lemma_dictionary.bin").')
+    args = parser.parse_args()
+    input_files = list_files(*args.input_files) if args.input_files else default_input_files()
+    create_dictionary(input_files, args.jobs, args.binary, args.cache_dir)
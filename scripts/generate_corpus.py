@@ -0,0 +1,125 @@
+#! usr/bin/env python3
+
+"""
+Generate a synthetic corpus in the SemCor3.0 format, for benchmarks and tests.
+
+The corpus has the layout of SemCor ('brown1', 'brown2' and 'brownv' directories with their
+'tagfiles' subdirectories; 103, 83 and 166 files at scale 1) and files of about 2000 tokens
+in paragraphs and sentences of 'wf' and 'punc' elements. Wordforms follow a Zipfian
+distribution over a synthetic lexicon; as in SemCor, they are sense tagged (pos, lemma, wnsn,
+lexsn), only tagged with a closed class pos, or untagged, and some are multiword expressions.
+In 'brownv' only verbs are sense tagged. The output only depends on the scale and the seed.
+"""
+
+from itertools import accumulate
+from pathlib import Path
+import random
+
+concordances = {'brown1': 103, 'brown2': 83, 'brownv': 166}
+file_letters = 'abcdefghjklmnpr'
+open_classes = {'NN': ('', 's'), 'VB': ('', 'ed', 'ing', 's'), 'JJ': ('',), 'RB': ('ly',)}
+closed_words = {'DT': ('the', 'a', 'an', 'this', 'that'), 'IN': ('of', 'in', 'to', 'for', 'with', 'on'),
+                'PRP': ('it', 'he', 'she', 'they', 'we'), 'CC': ('and', 'but', 'or'), 'TO': ('to',)}
+punctuation = (',', ',', ',', ';', ':', '``', "''", '(', ')')
+syllables = ('ba', 'ko', 'ri', 'tu', 'me', 'sa', 'lo', 'ne', 'vi', 'da', 'po', 'gu', 'fe', 'hi', 'zo', 'ca')
+
+def make_lexicon(rng, size):
+    """Return a list of (lemma, pos) pairs, the most frequent first."""
+    lexicon = []
+    seen = set()
+    while len(lexicon) < size:
+        lemma = ''.join(rng.choice(syllables) for _ in range(rng.choice((1, 2, 2, 3, 3, 4))))
+        if lemma in seen:
+            continue
+        seen.add(lemma)
+        lexicon.append((lemma, rng.choice(('NN', 'NN', 'NN', 'VB', 'VB', 'JJ', 'RB'))))
+    return lexicon
+
+class CorpusGenerator:
+    """Generator of the text of synthetic tagfiles."""
+    def __init__(self, seed = 0, lexicon_size = 20000, tokens_per_file = 2000):
+        self.rng = random.Random(seed)
+        self.lexicon = make_lexicon(self.rng, lexicon_size)
+        self.cum_weights = list(accumulate(1 / rank for rank in range(1, lexicon_size + 1)))
+        self.tokens_per_file = tokens_per_file
+
+    def open_word(self):
+        lemma, pos = self.rng.choices(self.lexicon, cum_weights = self.cum_weights)[0]
+        wordform = lemma + self.rng.choice(open_classes[pos])
+        return wordform, pos, lemma
+
+    def wf(self, concordance):
+        """Return the line of a 'wf' element and its number of tokens."""
+        rng = self.rng
+        draw = rng.random()
+        if draw < 0.4:
+            pos = rng.choice(tuple(closed_words))
+            return '<wf cmd=ignore pos={}>{}</wf>'.format(pos, rng.choice(closed_words[pos])), 1
+        if draw < 0.42:
+            words = [self.open_word() for _ in range(rng.choice((2, 2, 3)))]
+            wordform = '_'.join(word[0] for word in words)
+            lemma = '_'.join(word[2] for word in words)
+            pos = words[0][1]
+        elif draw < 0.44:
+            wordform = rng.choice(('Fulton', 'Atlanta', 'Texas', 'Smith', 'A&amp;P'))
+            pos, lemma = 'NNP', wordform.lower()
+        else:
+            wordform, pos, lemma = self.open_word()
+        if draw > 0.97 or (concordance == 'brownv' and pos != 'VB'):
+            return '<wf cmd=tur>{}</wf>'.format(wordform), wordform.count('_') + 1
+        lexsn = '{}:{:02d}:{:02d}::'.format(2 if pos == 'VB' else 1, rng.randint(0, 40), rng.randint(0, 3))
+        return '<wf cmd=done pos={} lemma={} wnsn={} lexsn={}>{}</wf>'.format(
+            pos, lemma, rng.randint(1, 6), lexsn, wordform), wordform.count('_') + 1
+
+    def tagfile(self, concordance, name):
+        """Return the text of a tagfile."""
+        rng = self.rng
+        lines = ['<contextfile concordance=brown>', '<context filename={} paras=yes>'.format(name)]
+        tokens = 0
+        paragraph = 0
+        while tokens < self.tokens_per_file:
+            paragraph += 1
+            lines.append('<p pnum={}>'.format(paragraph))
+            for sentence in range(1, rng.randint(2, 8)):
+                lines.append('<s snum={}>'.format(sentence))
+                for _ in range(rng.randint(5, 30)):
+                    if rng.random() < 0.08:
+                        lines.append('<punc>{}</punc>'.format(rng.choice(punctuation)))
+                        tokens += 1
+                    else:
+                        line, count = self.wf(concordance)
+                        lines.append(line)
+                        tokens += count
+                lines.append('<punc>{}</punc>'.format(rng.choice(('.', '.', '.', '?', '!'))))
+                lines.append('</s>')
+                tokens += 1
+            lines.append('</p>')
+        lines += ['</context>', '</contextfile>', '']
+        return '\n'.join(lines)
+
+def generate_corpus(output_dir, scale = 1.0, seed = 0, tokens_per_file = 2000):
+    """Write a synthetic corpus of scale times the number of SemCor files in output_dir.
+    Returns the list of the files written."""
+    generator = CorpusGenerator(seed, tokens_per_file = tokens_per_file)
+    files = []
+    for concordance, count in concordances.items():
+        directory = Path(output_dir) / concordance / 'tagfiles'
+        directory.mkdir(parents = True, exist_ok = True)
+        for number in range(max(1, round(count * scale))):
+            name = 'br-{}{:02d}'.format(file_letters[number % len(file_letters)], number // len(file_letters) + 1)
+            filename = directory / name
+            filename.write_text(generator.tagfile(concordance, name))
+            files.append(filename)
+    return files
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Generates a synthetic corpus in the SemCor3.0 format.')
+    parser.add_argument('output_dir', type = Path, help = 'Directory where the brown1, brown2 and brownv directories are created.')
+    parser.add_argument('-s', '--scale', type = float, default = 1.0, help = 'Size of the corpus relative to SemCor (1 to 100, or less). Default is 1.')
+    parser.add_argument('--seed', type = int, default = 0, help = 'Seed of the random generator. Default is 0.')
+    parser.add_argument('-t', '--tokens_per_file', type = int, default = 2000, help = 'Approximate number of tokens per file. Default is 2000.')
+    args = parser.parse_args()
+    files = generate_corpus(args.output_dir, args.scale, args.seed, args.tokens_per_file)
+    print('{} files were generated in "{}".'.format(len(files), args.output_dir.as_posix()))
@@ -0,0 +1,125 @@
+#! usr/bin/env python3
+
+"""
+Compact, read-only lemma dictionaries for the Token class of transform_semcor.
+
+A dictionary maps each wordform to its resolution: the ambiguity analysis of its (pos, lemma) entries,
+computed once, with all strings interned, in the smallest form that answers Token.get_pos and
+Token.get_lemma (see resolve). It is loaded from the JSON file written by create_lemmadict, each entry
+being resolved as soon as it is parsed, or, if the file has the '.bin' suffix, memory-mapped from the
+binary format written by write_binary_dictionary, in which case entries are only decoded and resolved
+when they are looked up.
+"""
+
+from pathlib import Path
+from sys import intern
+import bisect
+import json
+import mmap
+
+magic = b'SEMCORD1'
+
+def resolve(entries):
+    """Compute the resolution of a sequence of (pos, lemma) entries (None if there are none):
+    the (pos, lemma) pair of a wordform with a single pos, the lemma (a string) of one whose entries
+    all share it, or the tuple of the (pos, lemma) pairs of an ambiguous one."""
+    entries = tuple({intern(pos): intern(lemma) for pos, lemma in entries}.items())
+    if not entries:
+        return None
+    if len(entries) == 1:
+        return entries[0]
+    lemma = entries[0][1]
+    if all(other == lemma for _, other in entries):
+        return lemma
+    return entries
+
+def resolved_pos(resolution, default):
+    """Pos and status of a wordform given its resolution (None if it is not in the dictionary)."""
+    if resolution is None:
+        return default, 'pos_unsure'
+    if isinstance(resolution, str):
+        return default, 'ok'
+    if isinstance(resolution[0], str):
+        return resolution[0], 'ok'
+    return default, 'pos_unsure'
+
+def resolved_lemma(resolution, pos, default):
+    """Lemma and status of a wordform with a pos given its resolution (None if it is not in the dictionary)."""
+    if resolution is None:
+        return default, 'lemma_unsure'
+    if isinstance(resolution, str):
+        return resolution, 'ok'
+    if isinstance(resolution[0], str):
+        return resolution[1], 'ok'
+    for entry_pos, lemma in resolution:
+        if entry_pos == pos:
+            return lemma, 'lemma_unsure'
+    return default, 'lemma_unsure'
+
+def resolve_object(pairs):
+    """object_pairs_hook of json.load: the entries of a wordform are resolved as soon as they are parsed,
+    so that their dictionaries are never built. The objects of the entries are the ones whose values
+    are strings (the lemmas as read); their resolutions are returned in a 1-tuple, which is never a string
+    (a resolution may be one), so that the object of the whole dictionary is recognised by its values."""
+    if pairs and isinstance(pairs[0][1], str):
+        return (resolve(pairs),)
+    return {intern(wordform): value[0] for wordform, value in pairs if isinstance(value, tuple) and value[0] is not None}
+
+def load_dictionary(dictionary_file):
+    """Load a dictionary from a JSON or a binary ('.bin') file."""
+    dictionary_file = Path(dictionary_file)
+    if dictionary_file.suffix == '.bin':
+        return MappedDictionary(dictionary_file)
+    with dictionary_file.open() as file:
+        dictionary = json.load(file, object_pairs_hook = resolve_object)
+    return dictionary if isinstance(dictionary, dict) else {}
+
+def write_binary_dictionary(dictionary, dictionary_file):
+    """Write a dictionary (wordform -> {pos: lemma}) in the binary format:
+    the magic string, the number of wordforms and the offsets of their records (unsigned 32 bit integers),
+    then the records 'wordform\\tpos\\tlemma[\\tpos\\tlemma...]' sorted by encoded wordform."""
+    records = ['\t'.join([wordform] + [value for entry in entries.items() for value in entry]).encode('utf-8')
+               for wordform, entries in sorted(dictionary.items(), key = lambda item: item[0].encode('utf-8'))]
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    with Path(dictionary_file).open('wb') as file:
+        file.write(magic)
+        file.write(len(records).to_bytes(4, 'little'))
+        for offset in offsets:
+            file.write(offset.to_bytes(4, 'little'))
+        file.write(b''.join(records))
+
+class MappedDictionary:
+    """Memory-mapped binary dictionary, with the same get method as the loaded dictionaries."""
+    def __init__(self, dictionary_file):
+        with Path(dictionary_file).open('rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(magic)] != magic:
+            raise ValueError('"{}" is not a binary lemma dictionary.'.format(dictionary_file))
+        self.count = int.from_bytes(self.map[len(magic):len(magic) + 4], 'little')
+        self.offsets = memoryview(self.map)[len(magic) + 4:len(magic) + 4 * (self.count + 2)].cast('I')
+        self.start = len(magic) + 4 * (self.count + 2)
+        self.decoded = {}
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        return self.map[self.start + self.offsets[index]:self.start + self.offsets[index + 1]]
+
+    def key(self, index):
+        record = self.record(index)
+        return record.split(b'\t', 1)[0]
+
+    def get(self, wordform, default = None):
+        if not wordform in self.decoded:
+            key = wordform.encode('utf-8')
+            index = bisect.bisect_left(range(self.count), key, key = self.key)
+            entries = None
+            if index < self.count and self.key(index) == key:
+                values = self.record(index).decode('utf-8').split('\t')[1:]
+                entries = resolve(zip(values[::2], values[1::2]))
+            self.decoded[wordform] = entries
+        resolution = self.decoded[wordform]
+        return default if resolution is None else resolution
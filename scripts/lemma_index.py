@@ -0,0 +1,104 @@
+#! usr/bin/env python3
+
+"""
+Persistent inverted index of the tokens of SemCor3.0 files.
+
+The index is an sqlite database mapping every lemma, wordform and lemma/pos of the token lists
+of transform_semcor.generate_tokenlist to its postings (file and token position), so that a
+concordance only needs to read the files, and consider the positions, where the types occur.
+Since lemmas of untagged words come from the lemma dictionary, the index records the hash of the
+dictionary it was built with, and the modification time, size and hash of every indexed file.
+"""
+
+from pathlib import Path
+import sqlite3
+from corpus_cache import file_hash, file_key, file_signature
+
+version = '1'
+kinds = ('lemma', 'wordform', 'lemma_pos')
+
+def token_types(wordform, lemma, pos):
+    """Return the types under which a token is indexed, in the order of kinds."""
+    return lemma, wordform, '/'.join([lemma, pos])
+
+class LemmaIndex:
+    """Connection to an index file."""
+    def __init__(self, index_file):
+        self.index_file = Path(index_file)
+        self.connection = sqlite3.connect(self.index_file.as_posix())
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime INTEGER, size INTEGER, hash TEXT);
+            CREATE TABLE IF NOT EXISTS postings (kind INTEGER, type TEXT, file INTEGER, position INTEGER);
+            CREATE INDEX IF NOT EXISTS postings_type ON postings (kind, type);
+            CREATE INDEX IF NOT EXISTS postings_file ON postings (file);
+            """)
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('version', version))
+        if self.get_meta('version') != version:
+            self.clear()
+        self.files = {path: (file_id, mtime, size, hash)
+                      for file_id, path, mtime, size, hash in self.connection.execute('SELECT * FROM files')}
+
+    def get_meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row and row[0]
+
+    def is_valid(self, dictionary_hash):
+        """Check whether the index was built with the given lemma dictionary."""
+        return self.get_meta('dictionary') == dictionary_hash
+
+    def is_fresh(self, filename):
+        """Check whether a file is indexed and has not changed since (same mtime and size, or same content)."""
+        entry = self.files.get(file_key(filename))
+        if not entry:
+            return False
+        mtime, size = file_signature(filename)
+        if (mtime, size) == entry[1:3]:
+            return True
+        return size == entry[2] and file_hash(filename) == entry[3]
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM postings')
+            self.connection.execute('DELETE FROM files')
+            self.connection.execute('DELETE FROM meta')
+            self.connection.execute('INSERT INTO meta VALUES (?, ?)', ('version', version))
+        self.files = {}
+
+    def add_file(self, filename, tokens):
+        """(Re)index a file from its (wordform, lemma, pos) tokens, in token list order."""
+        key = file_key(filename)
+        mtime, size = file_signature(filename)
+        hash = file_hash(filename)
+        with self.connection:
+            if key in self.files:
+                file_id = self.files[key][0]
+                self.connection.execute('DELETE FROM postings WHERE file = ?', (file_id,))
+                self.connection.execute('DELETE FROM files WHERE id = ?', (file_id,))
+            file_id = self.connection.execute('INSERT INTO files (path, mtime, size, hash) VALUES (?, ?, ?, ?)',
+                                              (key, mtime, size, hash)).lastrowid
+            self.connection.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)',
+                                        ((kind, wordtype, file_id, position)
+                                         for position, token in enumerate(tokens)
+                                         for kind, wordtype in enumerate(token_types(*token))))
+        self.files[key] = (file_id, mtime, size, hash)
+
+    def set_dictionary(self, dictionary_hash):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('dictionary', dictionary_hash))
+
+    def lookup(self, kind, types):
+        """Return a dictionary of the postings of the given types: file path -> sorted token positions."""
+        paths = {file_id: path for path, (file_id, *_) in self.files.items()}
+        types = list(types)
+        hits = {}
+        query = 'SELECT file, position FROM postings WHERE kind = ? AND type IN ({})'.format(', '.join('?' * len(types)))
+        for file_id, position in self.connection.execute(query, [kinds.index(kind)] + types):
+            hits.setdefault(paths[file_id], []).append(position)
+        for positions in hits.values():
+            positions.sort()
+        return hits
+
+    def close(self):
+        self.connection.close()
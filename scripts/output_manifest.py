@@ -0,0 +1,82 @@
+#! usr/bin/env python3
+
+"""
+Manifest of the per-file outputs of semcor2token and semcor2run, for incremental and resumable regeneration.
+
+The manifest ('manifest.json' in the output directory) records, for each input file, its output file,
+the signature (modification time and size) and hash of the input, the hash of the lemma dictionary
+and the fingerprint of the options the output was generated with. An output is up to date if all of
+them are unchanged (the input is only hashed again if its signature changed) and the output exists.
+Outputs are written to a temporary file and renamed, and the manifest is saved regularly in the
+same way, so that an interrupted run only regenerates what it had not recorded.
+"""
+
+from hashlib import sha1
+from pathlib import Path
+from time import perf_counter
+import json
+import os
+from corpus_cache import file_hash, file_key, file_signature
+
+version = 1
+manifest_name = 'manifest.json'
+
+def fingerprint(**options):
+    """Fingerprint of the options of a run (and of the version of the manifest)."""
+    return sha1(json.dumps(dict(options, version = version), sort_keys = True).encode('utf-8')).hexdigest()
+
+def write_atomically(output_file, text):
+    """Write text in output_file through a temporary file, so that output_file is either the old or the new one."""
+    output_file = Path(output_file)
+    temporary = output_file.with_name(output_file.name + '.tmp')
+    with temporary.open('w') as file:
+        file.write(text)
+    os.replace(temporary, output_file)
+
+class OutputManifest:
+    """Manifest of an output directory for a dictionary hash and an options fingerprint."""
+    def __init__(self, output_dir, dictionary_hash, options, save_interval = 1.0):
+        self.output_dir = Path(output_dir)
+        self.manifest_file = self.output_dir / manifest_name
+        self.dictionary_hash = dictionary_hash
+        self.options = options
+        self.save_interval = save_interval
+        self.entries = {}
+        if self.manifest_file.exists():
+            with self.manifest_file.open() as file:
+                manifest = json.load(file)
+            if manifest.get('version') == version:
+                self.entries = manifest['files']
+        self.saved = perf_counter()
+        self.changed = False
+
+    def is_fresh(self, input_file, output_file):
+        """Tell whether output_file (relative to the output directory) is up to date for input_file."""
+        entry = self.entries.get(file_key(input_file))
+        if (entry is None or entry['output'] != Path(output_file).as_posix() or entry['dictionary'] != self.dictionary_hash
+                or entry['options'] != self.options or not (self.output_dir / output_file).is_file()):
+            return False
+        mtime, size = file_signature(input_file)
+        if mtime == entry['mtime'] and size == entry['size']:
+            return True
+        if size == entry['size'] and file_hash(input_file) == entry['hash']:
+            entry['mtime'] = mtime
+            self.changed = True
+            return True
+        return False
+
+    def record(self, input_file, output_file):
+        """Record that output_file was generated from input_file; the manifest is saved at most every save_interval seconds."""
+        mtime, size = file_signature(input_file)
+        self.entries[file_key(input_file)] = {'output': Path(output_file).as_posix(), 'mtime': mtime, 'size': size,
+                                              'hash': file_hash(input_file), 'dictionary': self.dictionary_hash,
+                                              'options': self.options}
+        self.changed = True
+        if perf_counter() - self.saved >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if self.changed:
+            write_atomically(self.manifest_file, json.dumps({'version': version, 'files': self.entries}))
+            self.changed = False
+        self.saved = perf_counter()
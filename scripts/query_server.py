@@ -0,0 +1,59 @@
+#! usr/bin/env python3
+
+"""
+Minimal local HTTP server for the serve subcommand of transform_semcor.
+
+It listens on a TCP port of the local host or on a Unix socket, handles each request in a thread,
+and answers GET queries with a function of the path and the query parameters
+(as parsed by urllib.parse.parse_qs) that returns the status, the content type and the body.
+KeyError and ValueError raised by the function are reported as invalid queries (status 400).
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from sys import stderr
+from urllib.parse import parse_qs, urlsplit
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def make_handler(answer):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            try:
+                status, content_type, body = answer(url.path, parse_qs(url.query))
+            except (KeyError, ValueError) as error:
+                status, content_type, body = 400, 'text/plain; charset=utf-8', 'Invalid query: {}\n'.format(error)
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix socket'
+    return QueryHandler
+
+def serve(answer, host = '127.0.0.1', port = 8765, socket_path = None):
+    """Answer queries with answer until interrupted, on host:port or, if socket_path is given, on that Unix socket."""
+    handler = make_handler(answer)
+    if socket_path is not None:
+        socket_path = Path(socket_path)
+        if socket_path.is_socket():
+            socket_path.unlink()
+        server = ThreadingUnixHTTPServer(socket_path.as_posix(), handler)
+        print('Serving on the Unix socket "{}".'.format(socket_path.as_posix()), file = stderr)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print('Serving on http://{}:{}/.'.format(*server.server_address[:2]), file = stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and socket_path.is_socket():
+            socket_path.unlink()
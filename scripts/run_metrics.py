@@ -0,0 +1,161 @@
+#! usr/bin/env python3
+
+"""
+Instrumentation of the runs of transform_semcor (--profile, --metrics_json, --cprofile).
+
+Each file is measured by a FileMetrics in the process that handles it: the time of every stage
+and a few counts. Stages are timed by wrapping the functions that implement them (see timed);
+a stage only gets the time of its own code, not that of the timed functions it calls, so the
+times of a file add up to the time spent on it. Nothing is wrapped unless a run is measured.
+The records of the files are collected in order by the RunMetrics of the main process,
+which aggregates them into a report (and merges the cProfile statistics of the files, if any).
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from sys import stderr
+from time import perf_counter
+import json
+
+stages = ('parse', 'tag', 'resolution', 'multiword', 'tokenlist', 'context', 'output')
+counters = ('elements', 'tags', 'components', 'dictionary_hits', 'dictionary_misses',
+            'memo_hits', 'memo_misses', 'pos_unsure', 'lemma_unsure')
+
+class FileMetrics:
+    """Timings and counts of the processing of one file.
+    The class attributes tell whether the runs of the process are measured (and profiled with cProfile)
+    and which FileMetrics the timed functions report to."""
+    enabled = False
+    cprofile = False
+    current = None
+
+    def __init__(self, filename):
+        self.file = filename.as_posix()
+        self.times = dict.fromkeys(stages, 0.0)
+        self.counts = dict.fromkeys(counters, 0)
+        self.nested = 0.0
+        self.profile = None
+
+    @contextmanager
+    def measure(self, stage):
+        """Add the time of the block, minus that of the timed functions called in it, to stage."""
+        outer = self.nested
+        self.nested = 0.0
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.times[stage] += elapsed - self.nested
+            self.nested = outer + elapsed
+
+    def run(self, function, *args, **kwargs):
+        """Call function as the current FileMetrics, under cProfile if the process profiles."""
+        FileMetrics.current = self
+        profiler = None
+        if FileMetrics.cprofile:
+            import cProfile
+            profiler = cProfile.Profile()
+        try:
+            if profiler is None:
+                return function(*args, **kwargs)
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            FileMetrics.current = None
+            if profiler is not None:
+                profiler.create_stats()
+                self.profile = profiler.stats
+
+    def record(self):
+        return {'file': self.file, 'seconds': sum(self.times.values()), 'times': self.times, 'counts': self.counts}
+
+def timed(stage, function, count = None):
+    """Wrap function so that its own time is added to stage of the current FileMetrics;
+    count, if given, is called with the counts of the FileMetrics and the result."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        metrics = FileMetrics.current
+        if metrics is None:
+            return function(*args, **kwargs)
+        outer = metrics.nested
+        metrics.nested = 0.0
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            metrics.times[stage] += elapsed - metrics.nested
+            metrics.nested = outer + elapsed
+        if count is not None:
+            count(metrics.counts, result)
+        return result
+    return wrapper
+
+class ProfileStats:
+    """cProfile statistics of a file, in the form pstats loads them from a profiler."""
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class RunMetrics:
+    """Metrics of a whole run, gathered in the main process from the records of the files.
+    multiword tells whether the tokens output by the run are whole tags or their components."""
+    current = None
+
+    def __init__(self, command, jobs, cprofile = False, multiword = False):
+        self.command = command
+        self.jobs = jobs
+        self.cprofile = cprofile
+        self.multiword = multiword
+        self.files = []
+        self.times = dict.fromkeys(stages, 0.0)
+        self.counts = dict.fromkeys(counters, 0)
+        self.profile = None
+        self.start = perf_counter()
+
+    def collect(self, results):
+        """Take the FileMetrics out of the (result, FileMetrics) pairs of process_files."""
+        for result, metrics in results:
+            self.add(metrics)
+            yield result
+
+    def add(self, metrics):
+        self.files.append(metrics.record())
+        for stage, seconds in metrics.times.items():
+            self.times[stage] += seconds
+        for counter, count in metrics.counts.items():
+            self.counts[counter] += count
+        if metrics.profile is not None:
+            import pstats
+            if self.profile is None:
+                self.profile = pstats.Stats(ProfileStats(metrics.profile))
+            else:
+                self.profile.add(ProfileStats(metrics.profile))
+
+    def report(self):
+        return {'command': self.command, 'jobs': self.jobs, 'multiword': self.multiword, 'wall_seconds': perf_counter() - self.start,
+                'file_seconds': sum(self.times.values()), 'files': len(self.files),
+                'times': self.times, 'counts': self.counts, 'per_file': self.files}
+
+    def print_summary(self, file = stderr):
+        report = self.report()
+        print('{} files in {:.3f} s ({:.3f} s in files, over {} jobs).'.format(
+            report['files'], report['wall_seconds'], report['file_seconds'], self.jobs), file = file)
+        for stage, seconds in self.times.items():
+            share = seconds / report['file_seconds'] if report['file_seconds'] else 0
+            print('{:<12}{:>10.3f} s{:>8.1%}'.format(stage, seconds, share), file = file)
+        for counter, count in self.counts.items():
+            print('{:<20}{:>10}'.format(counter, count), file = file)
+
+    def write_json(self, metrics_file):
+        with Path(metrics_file).open('w') as file:
+            json.dump(self.report(), file, indent = 2)
+
+    def dump_profile(self, profile_file):
+        if self.profile is None:
+            print('No file was profiled.', file = stderr)
+        else:
+            self.profile.dump_stats(profile_file)
@@ -0,0 +1,77 @@
+#! usr/bin/env python3
+
+"""
+Streaming reader for SemCor3.0 tagfiles.
+
+Instead of building a whole-document tree, the file is fed in chunks to lxml's HTML parser
+(the same parser BeautifulSoup used with 'lxml') and only the paragraph, sentence, 'wf' and
+'punc' elements are reported, incrementally and in document order, as iterparse-like events:
+('start', element) for 'p' and 's', ('end', element) for 'p', 's', 'wf' and 'punc'.
+"""
+
+from lxml import etree
+from corpus_archives import open_file
+
+chunk_size = 1 << 16
+
+class Element:
+    """Lightweight replacement of a BeautifulSoup tag: name, attributes and string."""
+    __slots__ = ('name', 'attrs', 'string')
+
+    def __init__(self, name, attrs, string = None):
+        self.name = name
+        self.attrs = attrs
+        self.string = string
+
+    def get(self, key, default = None):
+        return self.attrs.get(key, default)
+
+class _EventCollector:
+    """Target for the lxml parser: collects the events produced by each fed chunk."""
+    def __init__(self):
+        self.events = []
+        self.current = None
+        self.strings = []
+
+    def start(self, tag, attrib):
+        if tag in ('wf', 'punc'):
+            self.current = Element(tag, dict(attrib))
+            self.strings = []
+        elif tag in ('p', 's'):
+            self.events.append(('start', Element(tag, dict(attrib))))
+
+    def data(self, data):
+        if self.current is not None:
+            self.strings.append(data)
+
+    def end(self, tag):
+        if self.current is not None and tag == self.current.name:
+            self.current.string = ''.join(self.strings) or None
+            self.events.append(('end', self.current))
+            self.current = None
+        elif tag in ('p', 's'):
+            self.events.append(('end', Element(tag, {})))
+
+    def close(self):
+        pass
+
+def iter_events(filename):
+    """Generate the events of a corpus file with bounded memory."""
+    collector = _EventCollector()
+    parser = etree.HTMLParser(target = collector, recover = True)
+    fed = False
+    with open_file(filename) as file:
+        for chunk in iter(lambda: file.read(chunk_size), ''):
+            parser.feed(chunk)
+            fed = True
+            yield from collector.events
+            collector.events = []
+    if fed:
+        parser.close()
+        yield from collector.events
+
+def iter_words(filename):
+    """Generate the 'wf' and 'punc' elements of a corpus file in document order."""
+    for event, element in iter_events(filename):
+        if event == 'end' and element.name in ('wf', 'punc'):
+            yield element
@@ -0,0 +1,128 @@
+#! usr/bin/env python3
+
+"""
+Writers of the semcor2r table in several formats, fed with rows (lists of strings) in batches.
+
+- 'tsv', 'tsv.gz' and 'tsv.zst': tab-separated text, plain or compressed with gzip or zstandard;
+- 'parquet' and 'feather': columnar Arrow formats, in which the columns with few distinct values
+  (concordance, file, PoS, lemma) are dictionary-encoded; they are written in row groups
+  (record batches) of batch_size rows.
+The text formats can be written to the standard output, with '-' as output file.
+The zstandard and pyarrow packages are only needed (and imported) for the formats that use them.
+"""
+
+from pathlib import Path
+from sys import stdout
+import gzip
+import io
+
+formats = ('tsv', 'tsv.gz', 'tsv.zst', 'parquet', 'feather')
+suffixes = {'.gz': 'tsv.gz', '.zst': 'tsv.zst', '.parquet': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+dictionary_columns = ('concordance', 'file', 'PoS', 'lemma')
+
+def infer_format(output_file, table_format = None):
+    """Return the given format or, if it is None, the one of the suffix of output_file (tsv by default)."""
+    return table_format or suffixes.get(Path(output_file).suffix, 'tsv')
+
+def import_optional(module, table_format):
+    try:
+        return __import__(module, fromlist = ['_'])
+    except ImportError:
+        raise ImportError('The {} format requires the "{}" package (pip install {}).'.format(
+            table_format, module.split('.')[0], module.split('.')[0])) from None
+
+def open_table(output_file, columns, table_format = None, batch_size = 65536):
+    """Open a writer of the table in output_file; the format is inferred from the suffix if it is None.
+    Raises ImportError if the format needs a package that is not installed."""
+    table_format = infer_format(output_file, table_format)
+    if table_format in ('parquet', 'feather'):
+        if Path(output_file).as_posix() == '-':
+            raise ValueError('The {} format cannot be written to the standard output.'.format(table_format))
+        return ArrowTableWriter(output_file, columns, table_format, batch_size)
+    return TextTableWriter(output_file, columns, table_format, batch_size)
+
+class TextTableWriter:
+    """Tab-separated table, written in chunks of batch_size rows."""
+    def __init__(self, output_file, columns, table_format = 'tsv', batch_size = 65536):
+        zstandard = import_optional('zstandard', table_format) if table_format == 'tsv.zst' else None
+        to_stdout = Path(output_file).as_posix() == '-'
+        if to_stdout:
+            stdout.flush()
+        binary = stdout.buffer if to_stdout else open(output_file, 'wb')
+        if table_format == 'tsv.gz':
+            self.file = gzip.open(binary, 'wt', compresslevel = 6, encoding = 'utf-8')
+        elif table_format == 'tsv.zst':
+            self.file = io.TextIOWrapper(zstandard.ZstdCompressor(level = 3).stream_writer(binary, closefd = False), encoding = 'utf-8')
+        else:
+            self.file = io.TextIOWrapper(binary, encoding = 'utf-8')
+        self.binary = None if to_stdout else binary
+        self.detach = to_stdout and table_format == 'tsv'
+        self.batch_size = batch_size
+        self.lines = []
+        self.file.write('\t'.join(columns) + '\n')
+
+    def write_rows(self, rows):
+        self.lines.extend('\t'.join(row) + '\n' for row in rows)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.lines))
+        self.lines = []
+
+    def close(self):
+        self.flush()
+        if self.detach:
+            self.file.flush()
+            self.file.detach()
+        else:
+            self.file.close()
+        if self.binary is not None:
+            self.binary.close()
+
+class ArrowTableWriter:
+    """Parquet or Feather table of string columns, written in record batches of batch_size rows.
+    Parquet row groups are written as they are filled; Feather batches are kept until the file is closed,
+    so that all of them share the same dictionaries."""
+    def __init__(self, output_file, columns, table_format = 'parquet', batch_size = 65536):
+        self.pa = import_optional('pyarrow', table_format)
+        self.output_file = Path(output_file)
+        self.columns = list(columns)
+        self.table_format = table_format
+        self.batch_size = batch_size
+        self.schema = self.pa.schema([(column, self.pa.dictionary(self.pa.int32(), self.pa.string())
+                                       if column in dictionary_columns else self.pa.string()) for column in self.columns])
+        self.rows = []
+        self.batches = []
+        self.writer = None
+        if table_format == 'parquet':
+            parquet = import_optional('pyarrow.parquet', table_format)
+            self.writer = parquet.ParquetWriter(self.output_file.as_posix(), self.schema)
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        while len(self.rows) >= self.batch_size:
+            self.write_batch(self.rows[:self.batch_size])
+            self.rows = self.rows[self.batch_size:]
+
+    def write_batch(self, rows):
+        arrays = []
+        for index, column in enumerate(self.columns):
+            array = self.pa.array([row[index] for row in rows], type = self.pa.string())
+            arrays.append(array.dictionary_encode() if column in dictionary_columns else array)
+        batch = self.pa.RecordBatch.from_arrays(arrays, schema = self.schema)
+        if self.writer is not None:
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.batches.append(batch)
+
+    def close(self):
+        if self.rows:
+            self.write_batch(self.rows)
+            self.rows = []
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            feather = import_optional('pyarrow.feather', self.table_format)
+            table = self.pa.Table.from_batches(self.batches, schema = self.schema).unify_dictionaries()
+            feather.write_feather(table, self.output_file.as_posix(), chunksize = self.batch_size)
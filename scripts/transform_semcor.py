@@ -9,11 +9,26 @@ and use their fixed attributes) or call the class and compile in different ways
 The Token class encapsulates such attributes.
 """
 
-from bs4 import BeautifulSoup
 from pathlib import Path
-from sys import modules, stderr
+from sys import modules, stderr, stdout
+from argparse import Namespace
+from contextlib import ExitStack, nullcontext
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache, partial
+from io import StringIO
+from create_lemmadict import list_files, map_files, merge_words, word_entries, write_dictionary
+from semcor_reader import iter_events
+from corpus_cache import CorpusCache, boundaries, compile_cache, file_hash, file_key
+from corpus_archives import read_key
+from lemma_index import LemmaIndex
+from lemma_dictionary import load_dictionary, resolved_lemma, resolved_pos
+from run_metrics import FileMetrics, RunMetrics, timed
+from table_writers import formats, open_table
+from collocations import CollocationCounts, columns as collocation_columns
+from itertools import chain
+from output_manifest import OutputManifest, fingerprint, write_atomically
 import json
-from create_lemmadict import list_files
 import re
 
 script_dir = Path(modules[__name__].__file__).parent
@@ -21,14 +36,15 @@ output_default = script_dir.resolve().parent / 'output'
 semcor_default = script_dir.resolve().parent / 'semcor'
 
 class Token:
-    """Encapsulates token information from the xml tag in the SemCor3.0 file."""
+    """Encapsulates token information from the xml tag in the SemCor3.0 file.
+    The lemma dictionary is only loaded (from dictionary_file) the first time it is consulted."""
     dictionary_file = output_default / 'great_pos_dict.json'
 #    dictionary_file = output_default / 'lemma_dictionary.json'
 #    if not dictionary_file.exists():
 #        from create_lemmadict import create_dictionary
 #        create_dictionary()
-    with dictionary_file.open() as file:
-        dictionary = json.load(file)
+    dictionary = None
+    __slots__ = ('wordform', 'pos', 'lemma', 'status', 'has_senses', 'wnsn', 'sense_key')
         
     def __init__(self, wordform, pos, lemma, senses = False, status = 'ok'):
         self.wordform = wordform
@@ -40,46 +56,82 @@ class Token:
             self.wnsn, self.sense_key = senses
             self.has_senses = True
             
+    @staticmethod
+    def get_dictionary():
+        """Return the lemma dictionary (wordform -> resolution, see lemma_dictionary), loading it if needed.
+        The lookups of measured runs are counted (see CountedDictionary)."""
+        if Token.dictionary is None:
+            Token.dictionary = load_dictionary(Token.dictionary_file)
+            if FileMetrics.enabled:
+                Token.dictionary = CountedDictionary(Token.dictionary)
+        return Token.dictionary
+
+    @staticmethod
+    def set_dictionary_file(dictionary_file):
+        """Change the lemma dictionary, discarding the loaded one and the memoized resolutions."""
+        if dictionary_file != Token.dictionary_file:
+            Token.dictionary_file = dictionary_file
+            Token.dictionary = None
+            Token.resolve.cache_clear()
+            TokenTable.resolved.clear()
+
     @staticmethod
     def get_pos(wordform, default='NA'):
-        """Extract the pos information from the dictionary."""
-        wf = Token.dictionary.get(wordform)
-        if wf and len(wf) == 1:
-            return list(wf.keys())[0], 'ok'
-        else:
-            if wf:
-                lemmas = list(wf.values())
-                status = 'ok' if lemmas.count(lemmas[0])==len(list(wf.values())) else 'pos_unsure'
-            else:
-                status = 'pos_unsure'
-            return default, status
-	
+        """Extract the pos information from the dictionary.
+        The resolution of the wordform is interpreted here rather than by resolved_pos, which is the same without the call."""
+        dictionary = Token.dictionary
+        if dictionary is None:
+            dictionary = Token.get_dictionary()
+        wf = dictionary.get(wordform)
+        if wf is None:
+            return default, 'pos_unsure'
+        if isinstance(wf, str):
+            return default, 'ok'
+        if isinstance(wf[0], str):
+            return wf[0], 'ok'
+        return default, 'pos_unsure'
+
     @staticmethod
     def get_lemma(wordform, pos, default=None):
-        """Extract the lemma information from the dictionary."""
-        wf = Token.dictionary.get(wordform)
-        default = default or wordform.lower()
-        if wf:
-            lemmas = list(wf.values())
-            if lemmas.count(lemmas[0])==len(list(wf.values())):
-                default, status = lemmas[0], 'ok'
-            else:
-                status = 'lemma_unsure'
-            return wf.get(pos, default), status
-        else:
-            return default, 'lemma_unsure'
+        """Extract the lemma information from the dictionary (as resolved_lemma does, inline)."""
+        dictionary = Token.dictionary
+        if dictionary is None:
+            dictionary = Token.get_dictionary()
+        wf = dictionary.get(wordform)
+        if wf is None:
+            return default or wordform.lower(), 'lemma_unsure'
+        if isinstance(wf, str):
+            return wf, 'ok'
+        if isinstance(wf[0], str):
+            return wf[1], 'ok'
+        for entry_pos, lemma in wf:
+            if entry_pos == pos:
+                return lemma, 'lemma_unsure'
+        return default or wordform.lower(), 'lemma_unsure'
+
+    @staticmethod
+    def resolve_component(wordform, pos, default_lemma):
+        """Pos, lemma and status of a component of a multiword expression (one dictionary lookup)."""
+        wf = Token.get_dictionary().get(wordform)
+        pos, status_pos = resolved_pos(wf, pos)
+        lemma, status_lemma = resolved_lemma(wf, pos, default_lemma or wordform.lower())
+        return pos, lemma, (status_pos, status_lemma)
+
+    @staticmethod
+    @lru_cache(maxsize = 1 << 16)
+    def resolve(wordform, pos, default_lemma):
+        """Memoized resolve_component."""
+        return Token.resolve_component(wordform, pos, default_lemma)
 		   
     @classmethod
     def from_multiword(cls, wordform, index, token):
         """Generate a Token instance from a component of a multiword expression."""
-        wordform = wordform
-        pos, status_pos = Token.get_pos(wordform, token.pos)
         if '_' in token.lemma and len(token.lemma.split('_')) == len(token.wordform.split('_')):
             default_lemma = token.lemma.split('_')[index]
         else:
             default_lemma = token.lemma
-        lemma, status_lemma = Token.get_lemma(wordform, pos, default_lemma)
-        return Token(wordform, pos, lemma, status = (status_pos, status_lemma))
+        pos, lemma, status = Token.resolve(wordform, token.pos, default_lemma)
+        return Token(wordform, pos, lemma, status = status)
 	
     @classmethod
     def from_tag(cls, tag):
@@ -106,15 +158,72 @@ class Token:
         return [Token.from_multiword(word, index, self) for index, word in enumerate(self.wordform.split('_'))]
 	
 class CorpusFile:
-    """File of the corpus, of which the main functions are methods."""
+    """File of the corpus, of which the main functions are methods.
+    If a compiled cache is loaded in CorpusFile.cache, fresh files are read from it instead of parsed."""
+    cache = None
+
     def __init__(self, filename):
+        self.filename = filename
         self.concordance = filename.parts[-3]
         self.shortname = filename.stem
-        with filename.open() as this_file:
-            self.text = BeautifulSoup(this_file, 'lxml')
+        self.parsed = None
+        self.tokens = None
+        self.tags = None
+        self.component_lists = None
+
+    def load(self):
+        """Parse the file once and keep its events, so that several consumers can read them;
+        the Tokens of its elements are then also made once (see tag and components)."""
+        if self.parsed is None:
+            self.parsed = list(self.events())
+            self.tags = {}
+            self.component_lists = {}
+
+    def tag(self, word):
+        """Return the Token of a 'wf' element, made (and resolved) only once per element if the file is loaded."""
+        if self.tags is None:
+            return Token.from_tag(word)
+        token = self.tags.get(word)
+        if token is None:
+            token = self.tags[word] = Token.from_tag(word)
+        return token
+
+    def components(self, word):
+        """Return the Tokens of the components of a 'wf' element, made only once per element if the file is loaded."""
+        if self.component_lists is None:
+            return Token.from_tag(word).get_components()
+        components = self.component_lists.get(word)
+        if components is None:
+            components = self.component_lists[word] = self.tag(word).get_components()
+        return components
+
+    def events(self):
+        """Stream the paragraph, sentence, 'wf' and 'punc' events of the file in document order."""
+        if self.parsed is not None:
+            return iter(self.parsed)
+        if CorpusFile.cache is not None and CorpusFile.cache.is_fresh(self.filename):
+            return CorpusFile.cache.events(self.filename)
+        return iter_events(self.filename)
+
+    def words(self):
+        """Stream the 'wf' and 'punc' elements of the file in document order."""
+        for event, element in self.events():
+            if event == 'end' and element.name in ('wf', 'punc'):
+                yield element
+
+    def token_table(self):
+        """Return the TokenTable of the file, computed once (from the string ids of the cache, if it is fresh there)."""
+        if self.tokens is None:
+            if CorpusFile.cache is not None and CorpusFile.cache.is_fresh(self.filename):
+                self.tokens = TokenTable.from_cache(CorpusFile.cache, self.filename)
+            else:
+                self.tokens = TokenTable(generate_tokenlist(self))
+        return self.tokens
 			
 class TextItem:
     """Encapsulates information of tokens to create a context in generate_context."""
+    __slots__ = ('wordform', 'spaced', 'pos', 'lemma', 'sense_key', 'paragraph_start', 'sentence_start', 'weight')
+
     def __init__(self, what, wordform, pos, lemma, paragraph_start, sentence_start, weight, sense_key = None):
         self.wordform = wordform
         self.spaced = ' ' + self.wordform if what == 'word' else self.wordform
@@ -124,6 +233,133 @@ class TextItem:
         self.paragraph_start = paragraph_start
         self.sentence_start = sentence_start
         self.weight = weight
+
+class TokenTable:
+    """Columnar token list of a file, built from the TextItems of generate_tokenlist without keeping them.
+    Wordforms, pos, lemmas and sense keys are stored as ids of the strings of the table (0 for None);
+    weights and character offsets are cumulative (item k covers the first k tokens), so that
+    generate_context finds the bounds of a context by binary search and builds its strings with
+    a single slice of the text of all tokens; paragraph_starts and sentence_starts are the indices
+    of the tokens that start a paragraph or a sentence.
+    Tables of cached files are built by from_cache; resolved keeps, for each cache and dictionary,
+    the items of every distinct token of the cache, so that each is only resolved once per process."""
+    resolved = {}
+
+    def __init__(self, tokens = ()):
+        self.strings = [None]
+        self.ids = {None: 0}
+        self.wordform_ids, self.pos_ids, self.lemma_ids, self.sense_key_ids = (array('L') for _ in range(4))
+        self.weights = array('L', [0])
+        self.offsets = array('L', [0])
+        self.paragraph_starts = array('L')
+        self.sentence_starts = array('L')
+        self.buffer = StringIO()
+        for token in tokens:
+            self.add(token.wordform, token.pos, token.lemma, token.sense_key, token.spaced, token.weight,
+                     token.paragraph_start, token.sentence_start)
+        self.close()
+
+    @classmethod
+    def from_cache(cls, cache, filename):
+        """Build the table of a cached file straight from its string ids, as generate_tokenlist would from its events,
+        without an Element, a Token or a TextItem per token."""
+        items = TokenTable.resolved.setdefault((cache.cache_file, Token.dictionary_file), {})
+        tokens, bounds = cache.file_tokens(filename)
+        bounds.reverse()
+        table = cls()
+        in_paragraph = in_sentence = paragraph_start = sentence_start = False
+        for index, ids in enumerate(tokens):
+            while bounds and bounds[-1][0] == index:
+                event, tag = boundaries[bounds.pop()[1]]
+                if tag == 'p':
+                    in_paragraph = event == 'start'
+                    paragraph_start = True
+                else:
+                    in_sentence = event == 'start' and in_paragraph
+                    sentence_start = True
+            if not in_sentence:
+                continue
+            if not ids in items:
+                items[ids] = token_items(cache.element(ids))
+            for item in items[ids]:
+                table.add(*item, paragraph_start, sentence_start)
+                paragraph_start = sentence_start = False
+        table.close()
+        return table
+
+    def add(self, wordform, pos, lemma, sense_key, spaced, weight, paragraph_start, sentence_start):
+        index = len(self.wordform_ids)
+        self.wordform_ids.append(self.intern(wordform))
+        self.pos_ids.append(self.intern(pos))
+        self.lemma_ids.append(self.intern(lemma))
+        self.sense_key_ids.append(self.intern(sense_key))
+        self.weights.append(self.weights[-1] + weight)
+        self.offsets.append(self.offsets[-1] + len(spaced))
+        if paragraph_start:
+            self.paragraph_starts.append(index)
+        if sentence_start:
+            self.sentence_starts.append(index)
+        self.buffer.write(spaced)
+
+    def close(self):
+        self.text = self.buffer.getvalue()
+        self.length = len(self.wordform_ids)
+
+    def __len__(self):
+        return self.length
+
+    def intern(self, string):
+        if not string in self.ids:
+            self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return self.ids[string]
+
+    def wordform(self, index):
+        return self.strings[self.wordform_ids[index]]
+
+    def pos(self, index):
+        return self.strings[self.pos_ids[index]]
+
+    def lemma(self, index):
+        return self.strings[self.lemma_ids[index]]
+
+    def sense_key(self, index):
+        return self.strings[self.sense_key_ids[index]]
+
+    def find(self, types, column = 'lemma'):
+        """Return the indices of the tokens whose lemma (or wordform or pos) is one of the types."""
+        wanted = {self.ids[wordtype] for wordtype in types if wordtype in self.ids}
+        return [index for index, string_id in enumerate(getattr(self, column + '_ids')) if string_id in wanted]
+
+    def unit(self, index, separator):
+        """Return the first and last + 1 indices of the paragraph or sentence of a token,
+        or of the whole list if separator is neither 'paragraph' nor 'sentence'."""
+        if separator == 'paragraph':
+            starts = self.paragraph_starts
+        elif separator == 'sentence':
+            starts = self.sentence_starts
+        else:
+            return 0, self.length
+        unit = bisect_right(starts, index)
+        first = starts[unit - 1] if unit else 0
+        last = starts[unit] if unit < len(starts) else self.length
+        return first, last
+
+    def slice(self, start, end):
+        """Return the text of the tokens from start to end - 1."""
+        return self.text[self.offsets[start]:self.offsets[end]]
+
+    def type_keys(self, kind_id):
+        """Return the type of every token as its wordform, lemma or lemma/pos (as in the token ids of semcor2conc).
+        Each distinct lemma/pos string is only built once."""
+        if kind_id == 'wordform':
+            return [self.strings[string_id] for string_id in self.wordform_ids]
+        if kind_id == 'lemma':
+            return [self.strings[string_id] for string_id in self.lemma_ids]
+        keys = {}
+        for pair in set(zip(self.lemma_ids, self.pos_ids)):
+            keys[pair] = '/'.join([self.strings[pair[0]], self.strings[pair[1]]])
+        return [keys[pair] for pair in zip(self.lemma_ids, self.pos_ids)]
 		
 
 def report_token_status(token, token_id):
@@ -143,207 +379,692 @@ def report_token_status(token, token_id):
         pass
         
 
-def generate_tokenlist(text):
+def token_items(word, corpus_file = None):
+    """Return the (wordform, pos, lemma, sense key, spaced wordform, weight) items of the TextItems
+    of a 'wf' or 'punc' element, as generate_tokenlist generates them (with the Tokens of corpus_file, if it is loaded)."""
+    if word.name == 'punc':
+        return [(word.string, word.name, word.string, None, word.string, 0)]
+    if corpus_file is None or corpus_file.tags is None:
+        great_token = Token.from_tag(word)
+        components = great_token.get_components()
+    else:
+        great_token = corpus_file.tag(word)
+        components = corpus_file.components(word)
+    sense_key = great_token.sense_key if great_token.has_senses else None
+    return [(token.wordform, token.pos, token.lemma, sense_key, ' ' + token.wordform, 1) for token in components]
+
+def generate_tokenlist(corpus_file):
     """Create a generator of instances of TextItems based on all elements of a corpus file.
+    Only words inside sentences inside paragraphs are taken into account.
     To be used in semcor2conc."""
-    for paragraph in text.find_all('p'):
-        paragraph_start = True
-        for sentence in paragraph.find_all('s'):
+    in_paragraph = in_sentence = False
+    for event, word in corpus_file.events():
+        if word.name == 'p':
+            in_paragraph = event == 'start'
+            paragraph_start = True
+        elif word.name == 's':
+            in_sentence = event == 'start' and in_paragraph
             sentence_start = True
-            for word in sentence.find_all(['wf', 'punc']):
-                if word.name == 'punc':
-                   yield TextItem(None, word.string, word.name, word.string, paragraph_start, sentence_start, 0)
-                   paragraph_start = False
-                   sentence_start = False
-                else:
-                   great_token = Token.from_tag(word)
-                   sense_key = great_token.sense_key if great_token.has_senses else None
-                   for token in great_token.get_components():
-                       yield TextItem('word', token.wordform, token.pos, token.lemma, paragraph_start, sentence_start, 1, sense_key)
-                       paragraph_start = False
-                       sentence_start = False
+        elif not in_sentence:
+            continue
+        else:
+           for wordform, pos, lemma, sense_key, spaced, weight in token_items(word, corpus_file):
+               yield TextItem('word' if weight else None, wordform, pos, lemma, paragraph_start, sentence_start, weight, sense_key)
+               paragraph_start = False
+               sentence_start = False
 
                 
-def generate_context(tokenlist, index, left_context, right_context, separator, length):
-    """Generates the strings for left and right context for semcor2conc.
+def generate_context(table, index, left_context, right_context, separator):
+    """Generates the strings for left and right context for semcor2conc from the TokenTable of a file.
+    The right context ends with the first token that brings its weight to right_context,
+    the left context starts with the first token that brings its weight, node included, over left_context;
+    neither crosses paragraph or sentence boundaries if separator is 'paragraph' or 'sentence'.
     Returns a tuple with both strings."""
-    if separator == 'paragraph':
-        nostop = lambda i: not tokenlist[i].paragraph_start
-    elif separator == 'sentence':
-        nostop = lambda i: not tokenlist[i].sentence_start
-    else:
-        nostop = True
+    weights = table.weights
+    first, last = table.unit(index, separator)
     """Define right context."""
-    i = index + 1
-    weight = tokenlist[i].weight
-    while i < length-1 and nostop and weight < right_context:
-        i += 1
-        weight += tokenlist[i].weight
-    right = "".join([token.spaced for token in tokenlist[index+1:i+1]])
+    end = min(bisect_left(weights, weights[index + 1] + right_context, index + 2), last)
+    right = table.slice(index + 1, max(end, index + 1))
     """Define left context."""
-    i = index
-    weight = tokenlist[i].weight
-    while i > 0 and nostop and weight <= left_context:
-        i -= 1
-        weight += tokenlist[i].weight
-    left = "".join([token.spaced for token in tokenlist[i:index]])
+    start = max(bisect_left(weights, weights[index + 1] - left_context, 0, index + 1) - 1, first)
+    left = table.slice(start, index)
     return left, right
 	
-def semcor2conc(args):
-    """Generate a concordance of the selected types.
-    Input_files and types must be lists/iterators;
-    left_context and right_context must be integers, default = 10;
-    valid separators are 'paragraph' and 'sentence', otherwise there are none."""
-    input_files = list_files(*args.input_files)
+def count_status(counts, token):
+    if token.status[0] == 'pos_unsure':
+        counts['pos_unsure'] += 1
+    if token.status[1] == 'lemma_unsure':
+        counts['lemma_unsure'] += 1
+
+def count_tag(counts, token, status = False):
+    counts['tags'] += 1
+    if status:
+        count_status(counts, token)
+
+def count_components(counts, tokens, status = True):
+    counts['components'] += len(tokens)
+    if status:
+        for token in tokens:
+            count_status(counts, token)
+
+def count_lookup(counts, resolution):
+    if resolution is None:
+        counts['dictionary_misses'] += 1
+    else:
+        counts['dictionary_hits'] += 1
+
+class CountedDictionary:
+    """Lemma dictionary of measured runs, which counts its hits and misses in the current FileMetrics."""
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+
+    def get(self, wordform, default = None):
+        resolution = self.dictionary.get(wordform)
+        if FileMetrics.current is not None:
+            count_lookup(FileMetrics.current.counts, resolution)
+        return default if resolution is None else resolution
+
+def instrument(multiword = False):
+    """Wrap the functions of each stage so that their time and counts are reported to FileMetrics.current.
+    The unsure statuses are counted once per output token: of the tags if multiword, of their components otherwise;
+    dictionary hits and misses are counted once per lookup, by the CountedDictionary that replaces the dictionary."""
+    global generate_context
+    if FileMetrics.enabled:
+        return
+    FileMetrics.enabled = True
+    Token.from_tag = classmethod(timed('tag', Token.from_tag.__func__, partial(count_tag, status = multiword)))
+    Token.get_components = timed('multiword', Token.get_components, partial(count_components, status = not multiword))
+    Token.get_pos = staticmethod(timed('resolution', Token.get_pos))
+    Token.get_lemma = staticmethod(timed('resolution', Token.get_lemma))
+    Token.resolve_component = staticmethod(timed('resolution', Token.resolve_component))
+    if Token.dictionary is not None:
+        Token.dictionary = CountedDictionary(Token.dictionary)
+    CorpusFile.token_table = timed('tokenlist', CorpusFile.token_table)
+    generate_context = timed('context', generate_context)
+
+def init_worker(cache_file, dictionary_file, cprofile = None, multiword = False):
+    """Prepare a worker process of map_files: the corpus cache is opened once per process,
+    and the lemma dictionary is loaded at most once per process (or inherited from the parent).
+    If cprofile is not None the run is measured, and profiled with cProfile if it is True."""
+    if cache_file is not None:
+        CorpusFile.cache = CorpusCache(cache_file)
+    Token.set_dictionary_file(dictionary_file)
+    if cprofile is not None:
+        instrument(multiword)
+        FileMetrics.cprofile = cprofile
+
+def measure_file(metrics, corpus_file, function, kwargs):
+    """Run function on a measured file: it is parsed first, so that parsing is timed apart,
+    and whatever time its timed functions do not take is counted as output."""
+    memo = Token.resolve.cache_info()
+    with metrics.measure('parse'):
+        corpus_file.load()
+    metrics.counts['elements'] = sum(1 for event, element in corpus_file.parsed if event == 'end' and element.name in ('wf', 'punc'))
+    with metrics.measure('output'):
+        result = function(corpus_file, **kwargs)
+    metrics.counts['memo_hits'] = Token.resolve.cache_info().hits - memo.hits
+    metrics.counts['memo_misses'] = Token.resolve.cache_info().misses - memo.misses
+    return result
+
+def apply_to_file(task, function, **kwargs):
+    """Run function on the CorpusFile of a task (an input file and the keyword arguments specific to it);
+    if the run is measured, return its FileMetrics with the result."""
+    input_file, file_kwargs = task
+    kwargs = dict(kwargs, **file_kwargs)
+    corpus_file = CorpusFile(input_file)
+    if not FileMetrics.enabled:
+        return function(corpus_file, **kwargs)
+    metrics = FileMetrics(input_file)
+    result = metrics.run(measure_file, metrics, corpus_file, function, kwargs)
+    return result, metrics
+
+def process_files(function, input_files, jobs, file_kwargs = None, **kwargs):
+    """Run a function of a CorpusFile (and kwargs) over the input files, in the given number of processes,
+    yielding the results in the order of input_files. file_kwargs, if given, holds the keyword arguments
+    specific to each file (a dict per input file), so that each task only carries those of its file.
+    If RunMetrics.current is set, the metrics of every file are collected in it."""
+    cache_file = CorpusFile.cache.cache_file if CorpusFile.cache is not None else None
+    run_metrics = RunMetrics.current
+    tasks = list(zip(input_files, file_kwargs or [{}] * len(input_files)))
+    results = map_files(partial(apply_to_file, function = function, **kwargs), tasks, jobs,
+                        initializer = init_worker,
+                        initargs = (cache_file, Token.dictionary_file) if run_metrics is None else
+                                   (cache_file, Token.dictionary_file, run_metrics.cprofile, run_metrics.multiword),
+                        key = lambda task: read_key(task[0]))
+    return results if run_metrics is None else run_metrics.collect(results)
+
+def prepare_output_dir(output_dir, default):
+    """Create the output directory if needed; if it is not valid, fall back to the default directory name in the output folder."""
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir():
+        try:
+            output_dir.mkdir()
+        except:
+            print('Invalid output directory name. Files will be stored in default directory.', file = stderr)
+            output_dir = output_default / default
+            if not output_dir.is_dir():
+                output_dir.mkdir()
+    return output_dir
+
+def is_stdout(output):
+    return Path(output).as_posix() == '-'
+
+def open_output(output_file):
+    """Open an output file for writing, to be used in a with statement; '-' is the standard output, which is left open."""
+    if is_stdout(output_file):
+        return nullcontext(stdout)
+    return Path(output_file).open('w')
+
+def report_progress(input_file):
+    print('File "{}" processed.'.format(input_file.stem), file = stderr)
+
+def tsv_lines(rows):
+    return ''.join('\t'.join(row) + '\n' for row in rows)
+
+def conc_output_file(args, output_dir = output_default):
+    """Output file of a concordance: args.output_file or, if it is None, one named after the types in output_dir."""
+    return Path(args.output_file or Path(output_dir) / '{}_conc.csv'.format('_'.join(args.types)))
+
+def conc_columns(args):
+    x = ['last', 'next', 'lemma'] if args.add_closest else ['lemma']
+    return ['concordance', 'file', 'token_id', 'left', 'wordform', 'right'] + x + ['pos', 'sense_key']
+
+def conc_header(args):
+    return '\t'.join(conc_columns(args)) + '\n'
+
+def file2conc(corpus_file, args, positions = None):
+    """Generate the concordance rows of one file for semcor2conc, as lists of strings.
+    If the positions of the types in the file are given (from the lemma index), its tokens are not scanned."""
     types = list(args.types)
-    output_file = args.output_file or output_default / '{}_conc.csv'.format('_'.join(types))
-    output_file = Path(output_file)
     left_context = args.left
     right_context = args.right
     separator = args.separator
     filter_pos = args.pos
     kind_id = args.kind_id
-    with output_file.open('w') as file:
-        x = 'last\tnext\tlemma' if args.add_closest else 'lemma'
-        file.write('\t'.join(['concordance', 'file', 'token_id', 'left', 'wordform', 'right', x, 'pos', 'sense_key\n']))
-        for input_file in input_files:
-            corpus_file = CorpusFile(input_file)
-            tokenlist = list(generate_tokenlist(corpus_file.text))
-            chosen_words = [index for (index, token) in enumerate(tokenlist) if token.lemma in types]
-            for word in chosen_words:
-                node = tokenlist[word]
-                pos = node.pos
-                if filter_pos and not re.match(r'{}'.format([x for x in filter_pos]), pos):
-                    continue
-                if kind_id == 'lemma_pos':
-                    wordtype = '/'.join([node.lemma, node.pos])
-                elif kind_id == 'wordform':
-                    wordtype = node.wordform
-                else:
-                    wordtype = node.lemma
-                token_id = '/'.join([wordtype, corpus_file.shortname, str(word + 1)])
-                left, right = generate_context(tokenlist, word, left_context, right_context, separator, len(tokenlist))
-                if args.add_closest:
-                    last = tokenlist[word-1].wordform
-                    following = tokenlist[word+1].wordform
-                    line = [corpus_file.concordance, corpus_file.shortname, token_id, left, node.wordform, right, last, following, node.lemma, pos, node.sense_key or 'NA']
-                else:
-                    line = [corpus_file.concordance, corpus_file.shortname, token_id, left, node.wordform, right, node.lemma, pos, node.sense_key or 'NA']
-                file.write('\t'.join(line) + '\n')
-            print('File "{}" processed.'.format(input_file.stem))
+    rows = []
+    table = corpus_file.token_table()
+    chosen_words = table.find(types) if positions is None else positions
+    for word in chosen_words:
+        wordform, pos, lemma = table.wordform(word), table.pos(word), table.lemma(word)
+        if filter_pos and not re.match(r'{}'.format([x for x in filter_pos]), pos):
+            continue
+        if kind_id == 'lemma_pos':
+            wordtype = '/'.join([lemma, pos])
+        elif kind_id == 'wordform':
+            wordtype = wordform
+        else:
+            wordtype = lemma
+        token_id = '/'.join([wordtype, corpus_file.shortname, str(word + 1)])
+        left, right = generate_context(table, word, left_context, right_context, separator)
+        sense_key = table.sense_key(word) or 'NA'
+        if args.add_closest:
+            last = table.wordform(word-1)
+            following = table.wordform(word+1)
+            rows.append([corpus_file.concordance, corpus_file.shortname, token_id, left, wordform, right, last, following, lemma, pos, sense_key])
+        else:
+            rows.append([corpus_file.concordance, corpus_file.shortname, token_id, left, wordform, right, lemma, pos, sense_key])
+    return rows
 
-def semcor2R(args):
-    """Generate a file to be read on R appending information from each file.
-    input_files is a list of files (or with one file).
-    If sense==True, multiword=True (multiword expressions are kept together)."""
-    input_files = list_files(*args.input_files)
+def index_hits(input_files, types, index_file):
+    """Use the lemma index, if it exists and was built with the current dictionary, to select the files where types occur.
+    Returns the files to process and, for each of them, the keyword arguments of file2conc:
+    the positions of the types if the file is indexed (and None if it is not)."""
+    hits = {}
+    if index_file is not None and Path(index_file).exists():
+        index = LemmaIndex(index_file)
+        if index.is_valid(file_hash(Token.dictionary_file)):
+            fresh = {file_key(input_file) for input_file in input_files if index.is_fresh(input_file)}
+            hits = {path: positions for path, positions in index.lookup('lemma', types).items() if path in fresh}
+            input_files = [input_file for input_file in input_files if file_key(input_file) in hits or not file_key(input_file) in fresh]
+        index.close()
+    return input_files, [{'positions': hits.get(file_key(input_file))} for input_file in input_files]
+
+def semcor2conc(args):
+    """Generate a concordance of the selected types.
+    Input_files and types must be lists/iterators;
+    left_context and right_context must be integers, default = 10;
+    valid separators are 'paragraph' and 'sentence', otherwise there are none."""
+    input_files, file_kwargs = index_hits(list_files(*args.input_files), list(args.types), args.index)
+    with open_output(conc_output_file(args)) as file:
+        file.write(conc_header(args))
+        for input_file, rows in zip(input_files, process_files(file2conc, input_files, args.jobs, file_kwargs, args = args)):
+            file.write(tsv_lines(rows))
+            report_progress(input_file)
+
+def R_output_file(args):
     output_file = Path(args.output_file)
+    if args.sense and output_file == output_default / 'semcor2r.csv':
+        output_file = output_default / 'semcor2r_semtagged.csv'
+    return output_file
+
+def R_columns(args):
+    columns = ["concordance", "file", "token_id", "wordform", "PoS", "lemma"]
+    if args.sense:
+        columns += ['wnsn', 'sense_key']
+    return columns
+
+def file2R(corpus_file, args):
+    """Generate the rows of one file for semcor2R, as lists of strings."""
     senses = args.sense
     multiword = senses or args.multiword
-    if senses and output_file == output_default / 'semcor2r.csv':
-        output_file = output_default / 'semcor2r_semtagged.csv'
-    with output_file.open('w') as file:
-        file.write("\t".join(["concordance", "file", "token_id", "wordform", "PoS", "lemma"]))
-        if senses:
-            file.write('\twnsn\tsense_key')
-        file.write('\n')
-        for input_file in input_files:
-            corpus_file = CorpusFile(input_file)
-            for word in corpus_file.text.find_all(['wf', 'punc']):
-                index = 0
-                if word.name == 'punc':
-                    index += 1
-                    continue
-                if not multiword:
-                    for token in Token.from_tag(word).get_components():
-                        token_id = '/'.join([corpus_file.shortname, token.wordform, str(index)])
-                        if args.verbose and type(token.status)==tuple:
-                            report_token_status(token, token_id)
-                        file.write('\t'.join([corpus_file.concordance, corpus_file.shortname, token_id, token.wordform, token.pos, token.lemma]) + '\n')
-                        index += 1
-                else:
-                    token = Token.from_tag(word)
-                    if senses and not token.has_senses:
-                        continue
-                    token_id = '/'.join([corpus_file.shortname, token.wordform, str(index)])
-                    if args.verbose and type(token.status)==tuple:
-                        report_token_status(token, token_id)
-                    file.write('\t'.join([corpus_file.concordance, corpus_file.shortname, token_id, token.wordform, token.pos, token.lemma]))
-                    index += 1
-                    if senses:
-                        file.write('\t{}\t{}'.format(token.wnsn, token.sense_key))
-                        file.write('\n')
-            print('File "{}" processed.'.format(input_file.stem))
+    rows = []
+    for word in corpus_file.words():
+        index = 0
+        if word.name == 'punc':
+            index += 1
+            continue
+        if not multiword:
+            for token in corpus_file.components(word):
+                token_id = '/'.join([corpus_file.shortname, token.wordform, str(index)])
+                if args.verbose and type(token.status)==tuple:
+                    report_token_status(token, token_id)
+                rows.append([corpus_file.concordance, corpus_file.shortname, token_id, token.wordform, token.pos, token.lemma])
+                index += 1
+        else:
+            token = corpus_file.tag(word)
+            if senses and not token.has_senses:
+                continue
+            token_id = '/'.join([corpus_file.shortname, token.wordform, str(index)])
+            if args.verbose and type(token.status)==tuple:
+                report_token_status(token, token_id)
+            row = [corpus_file.concordance, corpus_file.shortname, token_id, token.wordform, token.pos, token.lemma]
+            index += 1
+            if senses:
+                row += [token.wnsn, token.sense_key]
+            rows.append(row)
+    return rows
 
-def semcor2token(args):
-    """Generate a file to be read by typetoken workflow for each original file."""
+def semcor2R(args):
+    """Generate a file to be read on R appending information from each file.
+    input_files is a list of files (or with one file).
+    If sense==True, multiword=True (multiword expressions are kept together).
+    The format is args.format or, if it is None, that of the suffix of the output file (see table_writers)."""
     input_files = list_files(*args.input_files)
-    output_dir = Path(args.output_dir)
-    if not output_dir.is_dir():
-        try:
-            output_dir.mkdir()
-        except:
-            print('Invalid output directory name. Files will be stored in default directory.', file = stderr)
-            output_dir = output_default / 'typetoken'
-            if not output_dir.is_dir():
-                output_dir.mkdir()
+    output_file = R_output_file(args)
+    try:
+        table = open_table(output_file, R_columns(args), args.format, args.batch_size)
+    except (ImportError, ValueError) as error:
+        raise SystemExit(str(error))
+    for input_file, rows in zip(input_files, process_files(file2R, input_files, args.jobs, args = args)):
+        table.write_rows(rows)
+        report_progress(input_file)
+    table.close()
+
+def file2token(corpus_file, args):
+    """Generate the typetoken rows of one corpus file for semcor2token:
+    concordance, file, wordform, lemma and pos of every token (punctuation marks included)."""
     multiword = args.multiword
-    for input_file in input_files:
-        corpus_file = CorpusFile(input_file)
-        filename = corpus_file.shortname + '.txt'
-        dirname = output_dir / corpus_file.concordance
-        if not dirname.exists():
-            dirname.mkdir()
-        output_file_name = dirname / filename
-        with output_file_name.open('w') as output_file:
-           for word in corpus_file.text.find_all(['wf', 'punc']):
-               if word.name == 'punc':
-                   output_file.write('\t'.join([word.string, word.string, 'punc\n']))
-               elif not multiword:
-                   for token in Token.from_tag(word).get_components():
-                       if args.verbose and type(token.status)==tuple:
-                           token_id = '/'.join([corpus_file.shortname, token.wordform])
-                           report_token_status(token, token_id)
-                       output_file.write('\t'.join([token.wordform, token.lemma, token.pos]) + '\n')
-               else:
-                   token = Token.from_tag(word)
-                   if args.verbose and type(token.status)==tuple:
-                       token_id = '/'.join([corpus_file.shortname, token.wordform])
-                       report_token_status(token, token_id)
-                   output_file.write('\t'.join([token.wordform, token.lemma, token.pos]) + '\n')
-		
+    rows = []
+    for word in corpus_file.words():
+        if word.name == 'punc':
+            rows.append([corpus_file.concordance, corpus_file.shortname, word.string, word.string, 'punc'])
+        elif not multiword:
+            for token in corpus_file.components(word):
+                if args.verbose and type(token.status)==tuple:
+                    token_id = '/'.join([corpus_file.shortname, token.wordform])
+                    report_token_status(token, token_id)
+                rows.append([corpus_file.concordance, corpus_file.shortname, token.wordform, token.lemma, token.pos])
+        else:
+            token = corpus_file.tag(word)
+            if args.verbose and type(token.status)==tuple:
+                token_id = '/'.join([corpus_file.shortname, token.wordform])
+                report_token_status(token, token_id)
+            rows.append([corpus_file.concordance, corpus_file.shortname, token.wordform, token.lemma, token.pos])
+    return rows
+
+def file2run(corpus_file, args):
+    """Generate the running text of one corpus file for semcor2run:
+    concordance, file and text (wordform/pos items) of every paragraph."""
+    multiword = args.multiword
+    rows = []
+    paragraph = None
+    for event, word in corpus_file.events():
+        if word.name == 'p':
+            if event == 'start':
+                paragraph = []
+            else:
+                rows.append([corpus_file.concordance, corpus_file.shortname, ''.join(paragraph)])
+                paragraph = None
+        elif paragraph is None or word.name == 's':
+            continue
+        elif word.name == 'punc':
+            paragraph.append(word.string)
+        elif not multiword:
+            for token in corpus_file.components(word):
+                paragraph.append(' {}/{}'.format(token.wordform, token.pos))
+        else:
+            token = corpus_file.tag(word)
+            paragraph.append(' {}/{}'.format(token.wordform, token.pos))
+    return rows
+
+def per_file_output(input_file):
+    """Path of the per-file output of an input file, relative to the output directory."""
+    corpus_file = CorpusFile(input_file)
+    return Path(corpus_file.concordance) / (corpus_file.shortname + '.txt')
+
+def write_per_file(output_dir, lines, input_file, rows, manifest = None):
+    """Write the rows of an input file (as converted by lines) in output_dir/concordance/file.txt, even if there are none,
+    and record it in manifest, if any; or stream them to the standard output, with their concordance and file, if output_dir is '-'."""
+    if is_stdout(output_dir):
+        stdout.write(tsv_lines(rows))
+        return
+    output_file = per_file_output(input_file)
+    (Path(output_dir) / output_file.parent).mkdir(exist_ok = True)
+    write_atomically(Path(output_dir) / output_file, lines(rows))
+    if manifest is not None:
+        manifest.record(input_file, output_file)
+
+def output_manifest(function, output_dir, args):
+    """Manifest of the per-file outputs of function in output_dir, for the dictionary and the options of args."""
+    return OutputManifest(output_dir, file_hash(Token.dictionary_file),
+                          fingerprint(output = function.__name__, multiword = args.multiword))
+
+def regenerate(function, lines, output_dir, args):
+    """Write the per-file outputs of function that are not up to date in output_dir (all of them if args.force),
+    recording them in its manifest, or stream all of them to the standard output if output_dir is '-'."""
+    input_files = list_files(*args.input_files)
+    if is_stdout(output_dir):
+        for input_file, rows in zip(input_files, process_files(function, input_files, args.jobs, args = args)):
+            write_per_file(output_dir, lines, input_file, rows)
+        return
+    manifest = output_manifest(function, output_dir, args)
+    stale = [input_file for input_file in input_files if args.force or not manifest.is_fresh(input_file, per_file_output(input_file))]
+    for input_file, rows in zip(stale, process_files(function, stale, args.jobs, args = args)):
+        write_per_file(output_dir, lines, input_file, rows, manifest)
+    manifest.save()
+    print('{} files written, {} up to date.'.format(len(stale), len(input_files) - len(stale)), file = stderr)
+
+def typetoken_lines(rows):
+    return tsv_lines(row[2:] for row in rows)
+
+def running_text_lines(rows):
+    return ''.join(row[2] + '\n' for row in rows)
+
+def semcor2token(args):
+    """Generate a file to be read by typetoken workflow for each original file.
+    Files that are up to date (same input, dictionary and options) are not generated again.
+    With '-' as output directory, the rows of all files are streamed to the standard output."""
+    output_dir = args.output_dir if is_stdout(args.output_dir) else prepare_output_dir(args.output_dir, 'typetoken')
+    regenerate(file2token, typetoken_lines, output_dir, args)
+
 def semcor2run(args):
     """Generate a file with running text (and wordform/pos format) to be read with
-    corpus analysis tools."""
+    corpus analysis tools.
+    Files that are up to date (same input, dictionary and options) are not generated again.
+    With '-' as output directory, the paragraphs of all files are streamed to the standard output."""
+    output_dir = args.output_dir if is_stdout(args.output_dir) else prepare_output_dir(args.output_dir, 'running_text')
+    regenerate(file2run, running_text_lines, output_dir, args)
+
+def iter_rows(function, input_files, jobs, **kwargs):
+    for rows in process_files(function, list_files(*input_files), jobs, **kwargs):
+        yield from rows
+
+def iter_records(input_files, sense = False, multiword = False, jobs = 1):
+    """Generate the rows of the semcor2r table (see R_columns) of the input files (or directories), file by file."""
+    args = Namespace(sense = sense, multiword = multiword, verbose = False)
+    return iter_rows(file2R, input_files, jobs, args = args)
+
+def iter_tokens(input_files, multiword = False, jobs = 1):
+    """Generate the concordance, file, wordform, lemma and pos of the tokens of the input files (or directories), file by file."""
+    args = Namespace(multiword = multiword, verbose = False)
+    return iter_rows(file2token, input_files, jobs, args = args)
+
+def iter_paragraphs(input_files, multiword = False, jobs = 1):
+    """Generate the concordance, file and running text of the paragraphs of the input files (or directories), file by file."""
+    args = Namespace(multiword = multiword)
+    return iter_rows(file2run, input_files, jobs, args = args)
+
+def iter_concordance(input_files, types, left = 10, right = 10, separator = 'paragraph', pos = None,
+                     kind_id = 'lemma_pos', add_closest = False, index = None, jobs = 1):
+    """Generate the concordance rows (see conc_columns) of types in the input files (or directories), file by file.
+    The options are those of semcor2conc; index is the path of a lemma index to use, if any."""
+    args = Namespace(types = list(types), left = left, right = right, separator = separator, pos = pos,
+                     kind_id = kind_id, add_closest = add_closest)
+    input_files, file_kwargs = index_hits(list_files(*input_files), args.types, index)
+    for rows in process_files(file2conc, input_files, jobs, file_kwargs, args = args):
+        yield from rows
+
+def file2collocates(corpus_file, args):
+    """Count the nodes (tokens whose lemma is one of args.types), the sizes of their windows, their collocates
+    and all the types of one file, in a CollocationCounts.
+    Windows are the args.left words before and args.right words after the node, within its paragraph or sentence
+    if args.separator is 'paragraph' or 'sentence'; they are found on the cumulative weights of the TokenTable,
+    word k of the file being the token whose weight brings the total to k + 1."""
+    table = corpus_file.token_table()
+    keys = table.type_keys(args.kind_id)
+    weights = table.weights
+    words = [index for index in range(len(table)) if weights[index + 1] > weights[index]]
+    counts = CollocationCounts()
+    counts.words = len(words)
+    counts.types.update(keys[index] for index in words)
+    for index in table.find(args.types):
+        if weights[index + 1] == weights[index]:
+            continue
+        node = keys[index]
+        first, last = table.unit(index, args.separator)
+        word = weights[index]
+        window = [keys[words[other]] for other in chain(range(max(word - args.left, weights[first]), word),
+                                                          range(word + 1, min(word + 1 + args.right, weights[last])))]
+        for sense_key in ('*', table.sense_key(index) or 'NA') if args.senses else ('*',):
+            counts.nodes[node, sense_key] += 1
+            counts.windows[node, sense_key] += len(window)
+            counts.pairs.update((node, sense_key, collocate) for collocate in window)
+    return counts
+
+def count_collocates(input_files, args):
+    counts = CollocationCounts()
+    for input_file, file_counts in zip(input_files, process_files(file2collocates, input_files, args.jobs, args = args)):
+        counts.add(file_counts)
+        report_progress(input_file)
+    return counts
+
+def iter_collocates(input_files, types, left = 5, right = 5, separator = 'sentence', kind_id = 'lemma_pos',
+                    senses = False, min_frequency = 1, jobs = 1):
+    """Generate the rows of the collocation table (see collocations.columns) of types in the input files (or directories).
+    The options are those of the collocates subcommand."""
+    args = Namespace(types = list(types), left = left, right = right, separator = separator, kind_id = kind_id,
+                     senses = senses)
+    counts = CollocationCounts()
+    for file_counts in process_files(file2collocates, list_files(*input_files), jobs, args = args):
+        counts.add(file_counts)
+    return counts.rows(min_frequency)
+
+def semcor2collocates(args):
+    """Generate a table of the collocates of the selected types (lemmas) with their frequencies, PMI and log-likelihood,
+    counted in one pass over the token lists of the files."""
     input_files = list_files(*args.input_files)
-    output_dir = Path(args.output_dir)
-    if not output_dir.is_dir():
-        try:
-            output_dir.mkdir()
-        except:
-            print('Invalid output directory name. Files will be stored in default directory.', file = stderr)
-            output_dir = output_default / 'running_text'
-            output_dir.mkdir()
-    multiword = args.multiword
-    for input_file in input_files:
-        corpus_file = CorpusFile(input_file)
-        filename = corpus_file.shortname + '.txt'
-        dirname = output_dir / corpus_file.concordance
-        if not dirname.exists():
-            dirname.mkdir()
-        output_file_name = dirname / filename
-        with output_file_name.open('w') as output_file:
-            for paragraph in corpus_file.text.find_all('p'):
-                for word in paragraph.find_all(['wf', 'punc']):
-                    if word.name == 'punc':
-                        output_file.write(word.string)
-                    elif not multiword:
-                        for token in Token.from_tag(word).get_components():
-                            output_file.write(' {}/{}'.format(token.wordform, token.pos))
-                    else:
-                        token = Token.from_tag(word)
-                        output_file.write(' {}/{}'.format(token.wordform, token.pos))
-                output_file.write('\n')
+    counts = count_collocates(input_files, args)
+    output_file = args.output_file or output_default / '{}_collocates.csv'.format('_'.join(args.types))
+    with open_output(output_file) as file:
+        file.write('\t'.join(collocation_columns) + '\n')
+        file.write(tsv_lines(counts.rows(args.min_frequency)))
+
+def file2dictionary(corpus_file):
+    """Return the (wordform, pos, lemma) triples of one file for the lemma dictionary."""
+    return word_entries(corpus_file.words())
+
+def file2all(corpus_file, sinks):
+    """Parse one file once and run the per-file function of every sink on it; the Tokens of its elements
+    are only made and resolved once for all the sinks (see CorpusFile.tag and CorpusFile.components).
+    Sinks are (function, keyword arguments) pairs; returns the list of their results."""
+    corpus_file.load()
+    return [function(corpus_file, **kwargs) for function, kwargs in sinks]
+
+def semcor2all(args):
+    """Generate any combination of the outputs of semcor2r, semcor2token, semcor2run, semcor2conc
+    (one or more queries) and the lemma dictionary, parsing every file only once.
+    Each output is registered as a sink: a per-file function with its arguments, a function that receives
+    the input files and their results in order and, for the per-file outputs of semcor2token and semcor2run,
+    the manifest of their directory: as in those subcommands, the files that are up to date in it are not
+    generated again (unless args.force), and files that no sink needs are not parsed."""
+    input_files = list_files(*args.input_files)
+    sinks = []
+    with ExitStack() as outputs:
+        if args.semcor2r:
+            r_args = Namespace(output_file = args.semcor2r, sense = args.sense, multiword = args.multiword, verbose = args.verbose)
+            try:
+                table = open_table(R_output_file(r_args), R_columns(r_args), args.format, args.batch_size)
+            except (ImportError, ValueError) as error:
+                raise SystemExit(str(error))
+            outputs.callback(table.close)
+            sinks.append((file2R, {'args': r_args}, lambda input_file, rows: table.write_rows(rows), None))
+        for types in args.semcor2conc or []:
+            conc_args = Namespace(types = types, output_file = None, left = args.left, right = args.right, pos = args.pos,
+                                           add_closest = args.add_closest, separator = args.separator, kind_id = args.kind_id)
+            file = outputs.enter_context(open_output(conc_output_file(conc_args, args.conc_dir)))
+            file.write(conc_header(conc_args))
+            sinks.append((file2conc, {'args': conc_args}, lambda input_file, rows, file = file: file.write(tsv_lines(rows)), None))
+        for function, lines, output_dir, default in ((file2token, typetoken_lines, args.semcor2token, 'typetoken'),
+                                                     (file2run, running_text_lines, args.semcor2run, 'running_text')):
+            if output_dir is None:
+                continue
+            manifest = None
+            if not is_stdout(output_dir):
+                output_dir = prepare_output_dir(output_dir, default)
+                manifest = output_manifest(function, output_dir, args)
+                outputs.callback(manifest.save)
+            sinks.append((function, {'args': args}, partial(write_per_file, output_dir, lines, manifest = manifest), manifest))
+        if args.lemmadict:
+            dictionary = {}
+            sinks.append((file2dictionary, {}, lambda input_file, words: merge_words(dictionary, words), None))
+        if not sinks:
+            print('No output was selected.', file = stderr)
+            return
+        tasks = []
+        for input_file in input_files:
+            stale = [sink for sink in sinks if sink[3] is None or args.force or not sink[3].is_fresh(input_file, per_file_output(input_file))]
+            if stale:
+                tasks.append((input_file, stale))
+        results = process_files(file2all, [input_file for input_file, _ in tasks], args.jobs,
+                                [{'sinks': [(function, kwargs) for function, kwargs, _, _ in stale]} for _, stale in tasks])
+        for (input_file, stale), file_results in zip(tasks, results):
+            for (_, _, receive, _), result in zip(stale, file_results):
+                receive(input_file, result)
+            report_progress(input_file)
+    print('{} files processed, {} up to date.'.format(len(tasks), len(input_files) - len(tasks)), file = stderr)
+    if args.lemmadict:
+        write_dictionary(dictionary, args.lemmadict)
+
+def compile_corpus(args):
+    """Compile the input files into the binary cache read by all other subcommands."""
+    input_files = list_files(*args.input_files)
+    cache_file = Path(args.cache)
+    parsed = compile_cache(input_files, cache_file)
+    print('The cache "{}" was compiled: {} files parsed, {} reused.'.format(cache_file.as_posix(), parsed, len(input_files) - parsed))
+
+def file2tokens(corpus_file):
+    """Return the (wordform, lemma, pos) tokens of the token list of one file, for the lemma index."""
+    table = corpus_file.token_table()
+    return [(table.wordform(index), table.lemma(index), table.pos(index)) for index in range(len(table))]
+
+def index_corpus(args):
+    """Build or update the inverted index used by semcor2conc. Only new or changed files are indexed,
+    unless the lemma dictionary changed."""
+    input_files = list_files(*args.input_files)
+    index = LemmaIndex(args.index)
+    dictionary_hash = file_hash(Token.dictionary_file)
+    if not index.is_valid(dictionary_hash):
+        index.clear()
+        index.set_dictionary(dictionary_hash)
+    stale = [input_file for input_file in input_files if not index.is_fresh(input_file)]
+    for input_file, tokens in zip(stale, process_files(file2tokens, stale, args.jobs)):
+        index.add_file(input_file, tokens)
+        print('File "{}" indexed.'.format(input_file.stem))
+    index.close()
+    print('The index "{}" is up to date: {} files indexed, {} reused.'.format(Path(args.index).as_posix(), len(stale), len(input_files) - len(stale)))
+
+def file2table(corpus_file):
+    return corpus_file.token_table()
+
+def query_values(params, name):
+    """Values of a query parameter, given repeated or separated by commas."""
+    return [value for values in params.get(name, []) for value in values.split(',') if value]
+
+def query_value(params, name, default, choices = None):
+    value = params.get(name, [default])[0]
+    if choices is not None and not value in choices:
+        raise ValueError('{} must be one of {}.'.format(name, ', '.join(choices)))
+    return value
+
+class LoadedCorpus:
+    """Token tables of the input files, loaded once, with an in-memory lemma index, for the serve subcommand.
+    The results of concordance queries are kept in an LRU cache keyed by their options."""
+    def __init__(self, input_files, jobs = 1, cache_size = 256):
+        self.files = []
+        self.names = {}
+        self.postings = {}
+        for input_file, table in zip(input_files, process_files(file2table, input_files, jobs)):
+            corpus_file = CorpusFile(input_file)
+            corpus_file.tokens = table
+            self.files.append(corpus_file)
+            self.names.setdefault(corpus_file.shortname, []).append(corpus_file)
+            key = file_key(input_file)
+            for index, lemma_id in enumerate(table.lemma_ids):
+                self.postings.setdefault(table.strings[lemma_id], {}).setdefault(key, []).append(index)
+        self.concordance = lru_cache(maxsize = cache_size)(self.concordance)
+
+    def concordance(self, types, pos, left, right, separator, kind_id, add_closest):
+        """Return the concordance rows of types, as semcor2conc would generate them with these options."""
+        args = Namespace(types = types, pos = pos and list(pos), left = left, right = right, separator = separator,
+                         kind_id = kind_id, add_closest = add_closest)
+        hits = {}
+        for wordtype in types:
+            for key, positions in self.postings.get(wordtype, {}).items():
+                hits.setdefault(key, []).extend(positions)
+        rows = []
+        for corpus_file in self.files:
+            key = file_key(corpus_file.filename)
+            if key in hits:
+                hits[key].sort()
+                rows.extend(file2conc(corpus_file, args, hits[key]))
+        return rows
+
+    def tokens(self, name, concordance = None, start = 0, end = None):
+        """Return the index, wordform, lemma, pos and sense key of the tokens of a file, from start to end - 1."""
+        candidates = [corpus_file for corpus_file in self.names[name] if concordance in (None, corpus_file.concordance)]
+        if len(candidates) != 1:
+            raise ValueError('"{}" does not identify one file; give its concordance too.'.format(name))
+        table = candidates[0].token_table()
+        return [[str(index), table.wordform(index), table.lemma(index), table.pos(index), table.sense_key(index) or 'NA']
+                for index in range(len(table))[start:end]]
+
+    def answer(self, path, params):
+        """Answer a query of the server: '/concordance', '/tokens' or '/stats'."""
+        as_json = query_value(params, 'format', 'tsv', ('tsv', 'json')) == 'json'
+        if path == '/concordance':
+            types = query_values(params, 'types')
+            if not types:
+                raise ValueError('types are required.')
+            add_closest = query_value(params, 'add_closest', 'false', ('true', 'false', '1', '0')) in ('true', '1')
+            options = Namespace(add_closest = add_closest)
+            rows = self.concordance(tuple(sorted(set(types))), tuple(query_values(params, 'pos')) or None,
+                                    int(query_value(params, 'left', '10')), int(query_value(params, 'right', '10')),
+                                    query_value(params, 'separator', 'paragraph', ('paragraph', 'sentence', 'None')),
+                                    query_value(params, 'kind_id', 'lemma_pos', ('wordform', 'lemma_pos', 'lemma')), add_closest)
+            columns = conc_columns(options)
+        elif path == '/tokens':
+            start = int(query_value(params, 'start', '0'))
+            end = query_value(params, 'end', None)
+            rows = self.tokens(query_value(params, 'file', None) or '', query_value(params, 'concordance', None),
+                               start, None if end is None else int(end))
+            columns = ['token', 'wordform', 'lemma', 'pos', 'sense_key']
+        elif path == '/stats':
+            stats = {'files': len(self.files), 'tokens': sum(len(corpus_file.token_table()) for corpus_file in self.files),
+                     'lemmas': len(self.postings), 'cache': self.concordance.cache_info()._asdict()}
+            return 200, 'application/json', json.dumps(stats)
+        else:
+            return 404, 'text/plain; charset=utf-8', 'Unknown query: use /concordance, /tokens or /stats.\n'
+        if as_json:
+            return 200, 'application/json', json.dumps([dict(zip(columns, row)) for row in rows])
+        return 200, 'text/tab-separated-values; charset=utf-8', '\t'.join(columns) + '\n' + tsv_lines(rows)
+
+def serve_corpus(args):
+    """Load the token tables of the input files once and answer concordance and token queries over HTTP until interrupted."""
+    input_files = list_files(*args.input_files)
+    corpus = LoadedCorpus(input_files, args.jobs, args.cache_size)
+    print('{} files loaded.'.format(len(corpus.files)), file = stderr)
+    from query_server import serve
+    serve(corpus.answer, args.host, args.port, args.socket)
 
     
 if __name__ == '__main__':
@@ -353,20 +1074,35 @@ if __name__ == '__main__':
     parent_parser.add_argument('-c', '--concordance', choices= ['brown1', 'brown2', 'brownv', 'semcor', 'all'],
                                help='Option to set input files with concordance or corpus name. Default is the whole corpus.')
     parent_parser.add_argument('-i', '--input_files', nargs='*', type = Path,
-                               help='Option to set input files with file names.')
+                               help='Option to set input files with file names, directories or tar/zip archives of the corpus.')
     parent_parser.add_argument('-m', '--multiword', help = 'Decides whether multiword expressions will be kept as such. Default is False.', action='store_true')
     parent_parser.add_argument('-v', '--verbose', help='Prints tokens with problematic tagging', action='store_true')
+    parent_parser.add_argument('-j', '--jobs', type = int, default = 1,
+                               help='Number of processes among which the files are distributed. Output order does not depend on it. Default is 1.')
+    parent_parser.add_argument('-d', '--dictionary', type = Path, default = Token.dictionary_file,
+                               help='Option to set the lemma dictionary, in JSON or binary (".bin") format. Default is "great_pos_dict.json" in the output folder.')
+    parent_parser.add_argument('--cache', type = Path, default = output_default / 'semcor.cache',
+                               help='Option to set the compiled corpus cache. It is used if it exists. Default is "semcor.cache" in the output folder.')
+    parent_parser.add_argument('--profile', action='store_true',
+                               help='Prints the time of every processing stage and the token, dictionary and ambiguity counts in standard error.')
+    parent_parser.add_argument('--metrics_json', '--metrics-json', type = Path,
+                               help='Option to write the timings and counts, per stage and per file, in a JSON file.')
+    parent_parser.add_argument('--cprofile', type = Path,
+                               help='Option to write the cProfile statistics of the processing of the files (readable with pstats).')
     subparsers = parser.add_subparsers(dest='command')
 	
     parser_semcor2r = subparsers.add_parser('semcor2r', help = 'Generates a table to be read with R from semcor files.', parents = [parent_parser])
-    parser_semcor2r.add_argument('-o', '--output_file', nargs = 1, default= './output/semcor2r.csv',
-                              help='Option to set an output file. Default is "semcor2r.csv" in the Output folder, "semcor2r_semtagged.csv" if sense is True.')
+    parser_semcor2r.add_argument('-o', '--output_file', default= './output/semcor2r.csv',
+                              help='Option to set an output file, "-" for the standard output. Default is "semcor2r.csv" in the Output folder, "semcor2r_semtagged.csv" if sense is True.')
     parser_semcor2r.add_argument('-s', '--sense', help = 'Decides whether only sense tagged words will be selected. Default is False.', action='store_true')
+    parser_semcor2r.add_argument('-f', '--format', choices = formats,
+                                 help = 'Sets the output format: tab-separated, compressed with gzip or zstd, parquet or feather (the last three need optional packages). Default is given by the suffix of the output file (".gz", ".zst", ".parquet", ".feather"), otherwise tsv.')
+    parser_semcor2r.add_argument('--batch_size', type = int, default = 65536, help = 'Number of rows written at once (row groups of parquet and feather). Default is 65536.')
     parser_semcor2r.set_defaults(function=semcor2R)
 	
     parser_semcor2conc = subparsers.add_parser('semcor2conc', help = 'Generates a concordance of selected types from semcor files.', parents = [parent_parser])
     parser_semcor2conc.add_argument('-t', '--types', nargs = "*", help = 'Types to be extracted for the concordance.', required=True)
-    parser_semcor2conc.add_argument('-o', '--output_file', help='Option to set an output file. Default is the list of types and "_conc.csv".', nargs = 1, default= None)
+    parser_semcor2conc.add_argument('-o', '--output_file', help='Option to set an output file, "-" for the standard output. Default is the list of types and "_conc.csv".', default= None)
     parser_semcor2conc.add_argument('-l', '--left', help = 'Sets length of left context. Default is 10.', default = 10, type = int)
     parser_semcor2conc.add_argument('-r', '--right', help = 'Sets length of right context. Default is 10.', default = 10, type = int)
     parser_semcor2conc.add_argument('-p', '--pos', nargs = '*', help = 'Sets the part-of-speech to filter. Default is not to filter.', type=str)
@@ -375,20 +1111,98 @@ if __name__ == '__main__':
                                     help = 'Sets separator for context. Options are "paragraph", "sentence" or "None". Default is "paragraph".')
     parser_semcor2conc.add_argument('-k', '--kind_id', choices = ['wordform', 'lemma_pos', 'lemma'],
                                     help = 'Option to define token id with wordform, lemma or lemma with part-of-speech (default).', default='lemma_pos')
+    parser_semcor2conc.add_argument('--index', type = Path, default = output_default / 'semcor.index',
+                                    help = 'Option to set the lemma index built with the "index" subcommand. It is used if it exists. Default is "semcor.index" in the output folder.')
     parser_semcor2conc.set_defaults(function=semcor2conc)
 	
     parser_semcor2token = subparsers.add_parser('semcor2token', help = 'Converts semcor files to corpus files to be read in typetoken workflow.', parents = [parent_parser])    
-    parser_semcor2token.add_argument('-o', '--output_dir', default = './Output/typetoken', help = 'Option to set an output directory. Default is "typeToken" in the Output directory.')
+    parser_semcor2token.add_argument('-o', '--output_dir', default = './Output/typetoken', help = 'Option to set an output directory, or "-" to write all tokens with their concordance and file to the standard output. Default is "typeToken" in the Output directory.')
+    parser_semcor2token.add_argument('--force', action='store_true', help = 'Regenerates all files, even those recorded as up to date in the manifest of the output directory.')
     parser_semcor2token.set_defaults(function=semcor2token)
     
     parser_semcor2run = subparsers.add_parser('semcor2run', help = 'Converts semcor files to corpus files to be read in typetoken workflow.', parents = [parent_parser])    
-    parser_semcor2run.add_argument('-o', '--output_dir', default = './output/running_text', help = 'Option to set an output directory. Default is "running_text" in the Output directory.')
+    parser_semcor2run.add_argument('-o', '--output_dir', default = './output/running_text', help = 'Option to set an output directory, or "-" to write all paragraphs with their concordance and file to the standard output. Default is "running_text" in the Output directory.')
+    parser_semcor2run.add_argument('--force', action='store_true', help = 'Regenerates all files, even those recorded as up to date in the manifest of the output directory.')
     parser_semcor2run.set_defaults(function=semcor2run)
     
+    parser_semcor2all = subparsers.add_parser('semcor2all', help = 'Generates several outputs of the other subcommands parsing semcor files only once.', parents = [parent_parser])
+    parser_semcor2all.add_argument('--semcor2r', nargs = '?', const = './output/semcor2r.csv', metavar = 'OUTPUT_FILE',
+                                   help = 'Generates the semcor2r table, in "semcor2r.csv" in the output folder by default.')
+    parser_semcor2all.add_argument('--sense', help = 'Decides whether only sense tagged words will be selected in the semcor2r table.', action='store_true')
+    parser_semcor2all.add_argument('-f', '--format', choices = formats, help = 'Sets the format of the semcor2r table, as in semcor2r. Default is given by its suffix.')
+    parser_semcor2all.add_argument('--batch_size', type = int, default = 65536, help = 'Number of rows of the semcor2r table written at once. Default is 65536.')
+    parser_semcor2all.add_argument('--semcor2token', nargs = '?', const = './Output/typetoken', metavar = 'OUTPUT_DIR',
+                                   help = 'Generates the semcor2token files, in "typetoken" in the output folder by default.')
+    parser_semcor2all.add_argument('--semcor2run', nargs = '?', const = './output/running_text', metavar = 'OUTPUT_DIR',
+                                   help = 'Generates the semcor2run files, in "running_text" in the output folder by default.')
+    parser_semcor2all.add_argument('--force', action='store_true', help = 'Regenerates all the semcor2token and semcor2run files, even those recorded as up to date in the manifests of their directories.')
+    parser_semcor2all.add_argument('--semcor2conc', nargs = '+', action = 'append', metavar = 'TYPE',
+                                   help = 'Generates a concordance of the given types; can be repeated for several concordances.')
+    parser_semcor2all.add_argument('--conc_dir', type = Path, default = output_default, metavar = 'OUTPUT_DIR',
+                                   help = 'Sets the folder of the concordances, named after their types as in semcor2conc. Default is the output folder.')
+    parser_semcor2all.add_argument('-l', '--left', help = 'Sets length of left context of the concordances. Default is 10.', default = 10, type = int)
+    parser_semcor2all.add_argument('-r', '--right', help = 'Sets length of right context of the concordances. Default is 10.', default = 10, type = int)
+    parser_semcor2all.add_argument('-p', '--pos', nargs = '*', help = 'Sets the part-of-speech to filter in the concordances. Default is not to filter.', type=str)
+    parser_semcor2all.add_argument('-a', '--add_closest', help = 'If true, adds two columns with the closest tokens to the concordances.', action='store_true')
+    parser_semcor2all.add_argument('--separator',  choices = ['paragraph', 'sentence', 'None'], default='paragraph',
+                                   help = 'Sets separator for the context of the concordances. Default is "paragraph".')
+    parser_semcor2all.add_argument('-k', '--kind_id', choices = ['wordform', 'lemma_pos', 'lemma'], default='lemma_pos',
+                                   help = 'Option to define token id of the concordances. Default is lemma with part-of-speech.')
+    parser_semcor2all.add_argument('--lemmadict', nargs = '?', const = output_default / 'lemma_dictionary.json', metavar = 'OUTPUT_FILE',
+                                   help = 'Generates the lemma dictionary, in "lemma_dictionary.json" in the output folder by default.')
+    parser_semcor2all.set_defaults(function=semcor2all)
+    
+    parser_collocates = subparsers.add_parser('collocates', help = 'Counts the collocates of selected types and scores their association.', parents = [parent_parser])
+    parser_collocates.add_argument('-t', '--types', nargs = "*", help = 'Lemmas of the nodes.', required=True)
+    parser_collocates.add_argument('-o', '--output_file', help='Option to set an output file, "-" for the standard output. Default is the list of types and "_collocates.csv".', default= None)
+    parser_collocates.add_argument('-l', '--left', help = 'Sets the number of words of the window before the node. Default is 5.', default = 5, type = int)
+    parser_collocates.add_argument('-r', '--right', help = 'Sets the number of words of the window after the node. Default is 5.', default = 5, type = int)
+    parser_collocates.add_argument('-s', '--separator',  choices = ['paragraph', 'sentence', 'None'], default='sentence',
+                                   help = 'Sets the unit that windows do not cross. Options are "paragraph", "sentence" or "None". Default is "sentence".')
+    parser_collocates.add_argument('-k', '--kind_id', choices = ['wordform', 'lemma_pos', 'lemma'], default='lemma_pos',
+                                   help = 'Option to identify nodes and collocates by wordform, lemma or lemma with part-of-speech (default).')
+    parser_collocates.add_argument('--senses', action='store_true', help = 'Also counts the collocates of every sense key of the nodes.')
+    parser_collocates.add_argument('--min_frequency', type = int, default = 1, help = 'Minimum co-occurrence frequency of the collocates in the output. Default is 1.')
+    parser_collocates.set_defaults(function=semcor2collocates)
+    
+    parser_serve = subparsers.add_parser('serve', help = 'Loads the corpus once and answers concordance and token queries over a local HTTP server.', parents = [parent_parser])
+    parser_serve.add_argument('--host', default = '127.0.0.1', help = 'Address to listen on. Default is 127.0.0.1 (only local connections).')
+    parser_serve.add_argument('--port', type = int, default = 8765, help = 'Port to listen on. Default is 8765.')
+    parser_serve.add_argument('--socket', type = Path, help = 'Option to listen on a Unix socket instead of a port.')
+    parser_serve.add_argument('--cache_size', type = int, default = 256, help = 'Number of recent concordance results kept in memory. Default is 256.')
+    parser_serve.set_defaults(function=serve_corpus)
+    
+    parser_compile = subparsers.add_parser('compile', help = 'Compiles semcor files into a binary cache that speeds up the other subcommands.', parents = [parent_parser])
+    parser_compile.set_defaults(function=compile_corpus)
+    
+    parser_index = subparsers.add_parser('index', help = 'Builds or updates the lemma index that speeds up semcor2conc.', parents = [parent_parser])
+    parser_index.add_argument('--index', type = Path, default = output_default / 'semcor.index',
+                              help = 'Option to set the index file. Default is "semcor.index" in the output folder.')
+    parser_index.set_defaults(function=index_corpus)
+    
     args = parser.parse_args()
     if args.concordance in ['brown1', 'brown2', 'brownv']:
         args.input_files = [semcor_default / args.concordance]
     elif args.concordance in ['all', 'semcor'] or args.input_files == None:
         args.input_files = semcor_default / 'brown1', semcor_default / 'brown2', semcor_default / 'brownv'
-    args.function(args)
+    Token.set_dictionary_file(args.dictionary)
+    if args.function != compile_corpus and args.cache.exists():
+        CorpusFile.cache = CorpusCache(args.cache)
+    if args.profile or args.metrics_json or args.cprofile:
+        multiword = args.multiword or (args.command == 'semcor2r' and args.sense)
+        RunMetrics.current = RunMetrics(args.command, args.jobs, args.cprofile is not None, multiword)
+    try:
+        args.function(args)
+    except BrokenPipeError:
+        # The reader of the standard output (e.g. head) closed it: stop quietly.
+        import os
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+        raise SystemExit(1)
+    if RunMetrics.current is not None:
+        if args.profile:
+            RunMetrics.current.print_summary()
+        if args.metrics_json:
+            RunMetrics.current.write_json(args.metrics_json)
+        if args.cprofile:
+            RunMetrics.current.dump_profile(args.cprofile)
    
\ No newline at end of file